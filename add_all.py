@@ -1,6 +1,7 @@
 import os
 from datetime import datetime
 from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
+from ffmpeg_stitch import FFmpegStitcher, FFmpegError
 
 class VideoAudioCombiner:
     def __init__(self, video_directory, audio_file):
@@ -8,6 +9,7 @@ class VideoAudioCombiner:
         self.audio_file = audio_file
         self.output_directory = "final_video"
         self.ending_video = "simplycodes_ending.mp4"
+        self.stitcher = FFmpegStitcher()
     
     def process(self):
         # Create output directory if it doesn't exist
@@ -15,6 +17,20 @@ class VideoAudioCombiner:
         
         # Get all video files and sort them
         video_files = self._get_sorted_video_files()
+
+        # Generate output filename
+        output_filename = f"final_video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+        output_path = os.path.join(self.output_directory, output_filename)
+
+        # Fast path: clips with identical codec, resolution, fps and timebase are stream copied
+        all_paths = [os.path.join(self.video_directory, vf) for vf in video_files + [self.ending_video]]
+        if self.stitcher.can_stream_copy(all_paths, audio_path=self.audio_file):
+            try:
+                self.stitcher.concat_copy(all_paths, output_path, self.audio_file)
+                print(f"Final video saved to: {output_path}")
+                return
+            except FFmpegError as e:
+                print(f"Stream copy failed, re-encoding instead: {str(e)}")
         
         # Load video clips and ensure consistent properties
         video_clips = []
@@ -53,10 +69,6 @@ class VideoAudioCombiner:
         # Set audio to final video
         final_video = final_video.set_audio(audio)
         
-        # Generate output filename
-        output_filename = f"final_video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-        output_path = os.path.join(self.output_directory, output_filename)
-        
         # Write final video
         final_video.write_videofile(output_path)
         
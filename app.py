@@ -13,6 +13,10 @@ from suno import SongGenerator
 import json
 from fal_train_lora import LoraTrainer
 from fal_lora_inference import FalLoraInference
+from ffmpeg_stitch import FFmpegStitcher, FFmpegError
+from pipeline_runner import PipelineRunner
+from gemini import GeminiDescriber
+from b_roll_search import BRollSearchIndex
 import numpy as np
 import zipfile
 import string
@@ -28,6 +32,9 @@ fal_generator = FalVideoGenerator()  # Replace luma_generator with fal_generator
 # Initialize song generator
 song_generator = SongGenerator()
 
+# Initialize ffmpeg stitcher (moviepy is used as a fallback)
+ffmpeg_stitcher = FFmpegStitcher()
+
 # Create directories if they don't exist
 def create_directories():
     directories = ['temp_uploaded', 'overlaid_img', 'background_img', 'gen_video', 'processed_img']
@@ -50,35 +57,29 @@ def get_unique_filename(directory, prefix, extension):
         counter += 1
     return full_path
 
-def generate_videos_parallel(*lora_images):
+def generate_videos_parallel(*lora_images, cancel_event=None):
     valid_images = [img for img in lora_images if img is not None]
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = f'gen_video_{timestamp}'
     os.makedirs(output_dir, exist_ok=True)
 
-    def generate_single_video(img, index):
-        # Save numpy array as image file
-        if isinstance(img, np.ndarray):
-            img_path = os.path.join(output_dir, f"input_image_{index}.png")
-            Image.fromarray(img).save(img_path)
-        else:
-            img_path = img
+    prompt = '''
+    Create an epic commercial video for a product based on this image. 
+    Include dynamic camera movements, dramatic lighting, and a sense of grandeur to showcase 
+    the product's features and benefits.
+    '''
 
+    jobs = []
+    for img in valid_images:
         # Generate a random hash
         random_hash = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
         
         output_path = os.path.join(output_dir, f"output_video_{random_hash}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4")
-        prompt = '''
-        Create an epic commercial video for a product based on this image. 
-        Include dynamic camera movements, dramatic lighting, and a sense of grandeur to showcase 
-        the product's features and benefits.
-        '''
-        fal_generator.generate_video(prompt, img_path, output_path)
-        return output_path
+        jobs.append((prompt, img, output_path))
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(generate_single_video, img, i) for i, img in enumerate(valid_images)]
-        results = [future.result() for future in concurrent.futures.as_completed(futures)]
+    # Submitted as one batch; numpy images are encoded in memory and uploaded without a PNG on disk.
+    # Results come back in the same order as the input images
+    results = fal_generator.generate_videos(jobs, cancel_event=cancel_event)
     
     # Pad with None values to always return 5 items
     return results + [None] * (5 - len(results))
@@ -91,6 +92,24 @@ def stitch_videos_with_audio(video_paths, audio_path):
         print("No valid video paths provided.")
         return None
     
+    # Ensure the output directory exists
+    output_dir = 'gen_video'
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = get_unique_filename(output_dir, 'final_stitched_video', 'mp4')
+
+    if ffmpeg_stitcher.is_available():
+        # Generated clips usually share codec, size and fps, so they can be stream copied
+        if ffmpeg_stitcher.can_stream_copy(valid_video_paths, audio_path=audio_path):
+            try:
+                return ffmpeg_stitcher.concat_copy(valid_video_paths, output_path, audio_path)
+            except FFmpegError as e:
+                print(f"ffmpeg stream copy failed, re-encoding instead: {str(e)}")
+        try:
+            # The clips were already probed above, so skip stitch's own copy check
+            return ffmpeg_stitcher.stitch(valid_video_paths, output_path, audio_path, allow_copy=False)
+        except FFmpegError as e:
+            print(f"ffmpeg stitching failed, falling back to moviepy: {str(e)}")
+
     try:
         video_clips = [VideoFileClip(path) for path in valid_video_paths]
 
@@ -103,11 +122,6 @@ def stitch_videos_with_audio(video_paths, audio_path):
                 audio_clip = audio_clip.subclip(0, final_clip.duration)
             final_clip = final_clip.set_audio(audio_clip)
         
-        # Ensure the output directory exists
-        output_dir = 'gen_video'
-        os.makedirs(output_dir, exist_ok=True)
-        
-        output_path = get_unique_filename(output_dir, 'final_stitched_video', 'mp4')
         final_clip.write_videofile(output_path)
         
         # Close all clips to free up resources
@@ -173,26 +187,32 @@ def load_loras():
     return loras
 
 # New function to generate images using LoRA
-def generate_lora_images(lora_url, prompt1, prompt2, prompt3, prompt4, prompt5):
+def generate_lora_images(lora_url, prompt1, prompt2, prompt3, prompt4, prompt5, max_workers=5):
     inference = FalLoraInference()
     prompts = [prompt1, prompt2, prompt3, prompt4, prompt5]
-    results = []
+    results = [None] * len(prompts)
     
     # Create a new directory with timestamp for this batch of images
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = f'lora_generated_images_{timestamp}'
     os.makedirs(output_dir, exist_ok=True)
-    
-    for i, prompt in enumerate(prompts):
-        if prompt:
-            output_path = os.path.join(output_dir, f"lora_generated_image_{i+1}.jpg")
-            result = inference.run_inference(prompt, lora_url, output_path)
-            if result:
-                results.append(output_path)
-            else:
-                results.append(None)
-        else:
-            results.append(None)
+
+    def generate_single_image(i, prompt):
+        output_path = os.path.join(output_dir, f"lora_generated_image_{i+1}.jpg")
+        result = inference.run_inference(prompt, lora_url, output_path)
+        return output_path if result else None
+
+    # Run the prompts concurrently, keeping each result in its prompt's slot
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(generate_single_image, i, prompt): i for i, prompt in enumerate(prompts) if prompt}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+                if results[i] is None:
+                    print(f"LoRA image {i+1}: no image generated")
+            except Exception as e:
+                print(f"LoRA image {i+1} failed: {str(e)}")
     
     return results
 
@@ -234,7 +254,19 @@ def update_b_roll_dropdown(file_or_folder):
     b_roll_videos = load_b_roll_videos(file_or_folder)
     return gr.Dropdown(choices=b_roll_videos, value=b_roll_videos[0] if b_roll_videos else None)
 
-def generate_video_script(video_outputs, b_roll_metadata, audio_output, product_description):
+b_roll_search_indexes = {}
+
+def find_b_roll_candidates(b_roll_metadata, product_description, lora_descriptions=None, top_k=12):
+    """Retrieve the B-roll clips whose metadata best matches the product and LoRA image descriptions.
+
+    Without any description to match on, the first top_k clips are offered instead.
+    """
+    if b_roll_metadata not in b_roll_search_indexes:
+        b_roll_search_indexes[b_roll_metadata] = BRollSearchIndex(b_roll_metadata, 'b_roll_cut')
+    queries = [product_description] + [d for d in (lora_descriptions or []) if d]
+    return b_roll_search_indexes[b_roll_metadata].search(queries, k=top_k)
+
+def generate_video_script(video_outputs, b_roll_metadata, audio_output, product_description, lora_descriptions=None, top_k=12):
     
     anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
     if not anthropic_api_key:
@@ -249,24 +281,16 @@ def generate_video_script(video_outputs, b_roll_metadata, audio_output, product_
         if video:
             content += f"- Video {i+1}: {os.path.abspath(video)}\n"
 
-    content += "\nB-roll videos:\n"
-    for video_name in os.listdir('b_roll_cut'):
-        content += f"- {os.path.abspath(os.path.join('b_roll_cut', video_name))}\n"
-
+    # Only the top-k matching clips go into the prompt, so its size doesn't grow with the library
     content += "\nB-roll videos and metadata:\n"
-    for json_file in os.listdir(b_roll_metadata):
-        if json_file.endswith('.json'):
-            try:
-                with open(os.path.join(b_roll_metadata, json_file), 'r') as f:
-                    json_content = f.read()
-                    metadata = json.loads(json_content)
-                    content += f"- {os.path.abspath(os.path.join(b_roll_metadata, json_file))}:\n"
-                    #content += f"  Prompt: {metadata.get('prompt', '')}\n"
-                    content += f"  Video metadata: {json_content}\n\n"
-            except json.JSONDecodeError:
-                logging.error(f"Error decoding JSON file: {json_file}")
-            except Exception as e:
-                logging.error(f"Error processing file {json_file}: {str(e)}")
+    try:
+        candidates = find_b_roll_candidates(b_roll_metadata, product_description, lora_descriptions, top_k)
+    except Exception as e:
+        logging.error(f"Error searching B-roll metadata: {str(e)}")
+        candidates = []
+    for video_path, metadata, score in candidates:
+        content += f"- {video_path}:\n"
+        content += f"  Video metadata: {json.dumps(metadata)}\n\n"
 
     content += "\nAudio file:\n"
     if audio_output:
@@ -346,8 +370,7 @@ def resize_and_pad_video(video_path, target_size=(1080, 1920)):
     
     return final_clip
 
-def stitch_new_video(video_outputs, audio_output, product_description):
-    b_roll_metadata = 'b_roll_metadata'
+def stitch_new_video(video_outputs, audio_output, product_description, b_roll_metadata='b_roll_metadata', lora_descriptions=None):
 
     print("Valid video outputs: ", video_outputs)
     
@@ -358,7 +381,7 @@ def stitch_new_video(video_outputs, audio_output, product_description):
         print("No valid video outputs found.")
         return None
 
-    video_file_json = generate_video_script(valid_video_outputs, b_roll_metadata, audio_output, product_description)
+    video_file_json = generate_video_script(valid_video_outputs, b_roll_metadata, audio_output, product_description, lora_descriptions)
     video_files = video_file_json["video_sequence"]
     video_files = video_files[:random.randint(8, 12)]
     print("Final video files to be stitched: ", video_files)
@@ -367,6 +390,17 @@ def stitch_new_video(video_outputs, audio_output, product_description):
         print("No video files found in the script. Using valid video outputs instead.")
         video_files = valid_video_outputs
     
+    output_dir = 'gen_video'
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = get_unique_filename(output_dir, 'final_stitched_video', 'mp4')
+
+    # Scale, pad and concat in a single ffmpeg pass when available
+    if ffmpeg_stitcher.is_available():
+        try:
+            return ffmpeg_stitcher.stitch(video_files, output_path, audio_output)
+        except FFmpegError as e:
+            print(f"ffmpeg stitching failed, falling back to moviepy: {str(e)}")
+
     # Resize and pad all videos to 9:16 aspect ratio
     resized_clips = [resize_and_pad_video(video_path) for video_path in video_files]
     
@@ -379,10 +413,6 @@ def stitch_new_video(video_outputs, audio_output, product_description):
             audio_clip = audio_clip.subclip(0, final_clip.duration)
         final_clip = final_clip.set_audio(audio_clip)
     
-    output_dir = 'gen_video'
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = get_unique_filename(output_dir, 'final_stitched_video', 'mp4')
-    
     final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac")
     
     # Close all clips
@@ -394,6 +424,64 @@ def stitch_new_video(video_outputs, audio_output, product_description):
     
     return output_path
 
+def index_b_roll(b_roll_dir='b_roll_cut'):
+    """Describe the B-roll clips with Gemini and return the metadata directory."""
+    if not os.path.isdir(b_roll_dir):
+        print(f"B-roll directory not found: {b_roll_dir}. Using existing metadata.")
+        return 'b_roll_metadata'
+    describer = GeminiDescriber()
+    describer.process_directory(b_roll_dir)
+    return str(describer.output_dir)
+
+def describe_lora_images(lora_images):
+    """Describe the generated LoRA images so B-roll retrieval can match their look; failures only lose the hint."""
+    images = [np.array(Image.open(path).convert("RGB")) if path else None for path in lora_images]
+    if not any(image is not None for image in images):
+        return []
+    try:
+        return GeminiDescriber().describe_lora_outputs(images)
+    except Exception as e:
+        print(f"Could not describe LoRA images: {str(e)}")
+        return []
+
+async def generate_full_commercial(lora_url, product_description, song_prompt, index_b_roll_videos, *prompts):
+    """Run the whole generate -> video -> music -> stitch pipeline as a DAG.
+
+    Song generation overlaps with LoRA inference and video rendering, and B-roll indexing
+    overlaps with LoRA inference, so the commercial finishes in the time of its critical path.
+    """
+    runner = PipelineRunner()
+    runner.add_stage("lora_images", lambda: generate_lora_images(lora_url, *prompts))
+    runner.add_stage("song", lambda: generate_song(song_prompt) if song_prompt else None)
+    if index_b_roll_videos:
+        runner.add_stage("b_roll_index", index_b_roll)
+    else:
+        runner.add_stage("b_roll_index", lambda: 'b_roll_metadata')
+    runner.add_stage(
+        "videos",
+        # Renders are billed while running, so stop them if another stage fails
+        lambda lora_images: generate_videos_parallel(*lora_images, cancel_event=runner.cancel_event),
+        deps=["lora_images"]
+    )
+    runner.add_stage(
+        "lora_descriptions",
+        lambda lora_images: describe_lora_images(lora_images),
+        deps=["lora_images"]
+    )
+    runner.add_stage(
+        "stitch",
+        lambda videos, song, b_roll_index, lora_descriptions: stitch_new_video(videos, song, product_description, b_roll_index, lora_descriptions),
+        deps=["videos", "song", "b_roll_index", "lora_descriptions"]
+    )
+
+    try:
+        results = await runner.run()
+    except Exception as e:
+        print(f"Error in commercial pipeline: {str(e)}")
+        return None, f"Pipeline failed: {str(e)}\n{runner.format_timings()}"
+
+    return results["stitch"], runner.format_timings()
+
 with gr.Blocks() as demo:
     gr.Markdown("# Auto Product Commercial")
 
@@ -476,6 +564,20 @@ with gr.Blocks() as demo:
         outputs=final_new_video_output
     )
 
+    gr.Markdown("## Generate Full Commercial")
+    song_prompt_full = gr.Textbox(label="Enter song prompt for the commercial")
+    index_b_roll_checkbox = gr.Checkbox(label="Re-index B-roll videos with Gemini", value=False)
+    full_commercial_btn = gr.Button("Generate Full Commercial")
+    with gr.Row():
+        full_commercial_output = gr.Video(label="Full Commercial")
+        pipeline_timings_output = gr.Textbox(label="Stage Timings", lines=8)
+
+    full_commercial_btn.click(
+        generate_full_commercial,
+        inputs=[lora_dropdown, product_description, song_prompt_full, index_b_roll_checkbox] + lora_prompts,
+        outputs=[full_commercial_output, pipeline_timings_output]
+    )
+
     upload_b_roll_btn.click(
         update_b_roll_dropdown,
         inputs=[b_roll_input],
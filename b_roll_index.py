@@ -0,0 +1,127 @@
+import os
+import json
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from result_cache import ResultCache
+
+
+class BRollIndex:
+    """Persistent manifest of described B-roll clips, keyed by file content hash.
+
+    The per-clip metadata JSON files stay in metadata_dir as before; a sibling <metadata_dir>_index.json
+    records, for each content hash, which file it came from and which describer version produced it.
+
+    Rules for deciding what to (re)describe:
+      - A clip is fresh if its content hash is in the index with the current describer version and
+        its metadata file still exists. Size and mtime are used to skip rehashing unchanged files.
+      - A changed file (new hash) is described again; its old entry becomes stale.
+      - A renamed or copied clip with known content reuses the existing metadata without a call; the
+        metadata file is copied to the new clip's name so a new clip under the old name can't overwrite it.
+      - A change of describer version (prompt, schema or model) invalidates every entry.
+      - Entries whose clip no longer exists in the directory being indexed are stale and are removed
+        by prune(), together with their metadata files. Entries from other source directories that
+        share the same metadata_dir are left alone.
+    """
+
+    def __init__(self, metadata_dir="b_roll_metadata", version=None):
+        self.metadata_dir = Path(metadata_dir)
+        self.metadata_dir.mkdir(parents=True, exist_ok=True)
+        # Kept beside the directory so readers that glob metadata_dir for *.json only see clip metadata
+        self.index_path = self.metadata_dir.with_name(f"{self.metadata_dir.name}_index.json")
+        self.version = version
+        self._lock = threading.Lock()
+        self.entries = {}
+        if self.index_path.exists():
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f).get("entries", {})
+
+    def _save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _by_path(self):
+        return {entry["path"]: (digest, entry) for digest, entry in self.entries.items()}
+
+    def content_hash(self, video_path, known=None):
+        """Hash of the clip's bytes, reusing the recorded hash when size and mtime are unchanged."""
+        stat = os.stat(video_path)
+        if known:
+            digest, entry = known
+            if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                return digest
+        return ResultCache.file_digest(video_path)
+
+    def is_fresh(self, digest):
+        entry = self.entries.get(digest)
+        return bool(entry and entry.get("version") == self.version
+                    and (self.metadata_dir / entry["metadata_file"]).exists())
+
+    def plan(self, video_files, force=False):
+        """Split video_files into (to_describe, reused) as lists of (path, digest)."""
+        by_path = self._by_path()
+        to_describe, reused = [], []
+        for video_path in video_files:
+            path = str(Path(video_path).resolve())
+            digest = self.content_hash(video_path, by_path.get(path))
+            if not force and self.is_fresh(digest):
+                reused.append((video_path, digest))
+            else:
+                to_describe.append((video_path, digest))
+        # Known content under a new name is re-pointed rather than described again
+        for video_path, digest in reused:
+            path = str(Path(video_path).resolve())
+            if self.entries[digest]["path"] != path:
+                self._repoint(video_path, digest)
+        return to_describe, reused
+
+    def _repoint(self, video_path, digest):
+        old_entry = self.entries[digest]
+        old_file = old_entry["metadata_file"]
+        new_file = f"{Path(video_path).stem}_metadata.json"
+        if new_file != old_file:
+            shutil.copyfile(self.metadata_dir / old_file, self.metadata_dir / new_file)
+        self.add(video_path, digest, new_file)
+        # A renamed clip leaves its old metadata file behind; a copy still needs it
+        still_used = any(entry["metadata_file"] == old_file for entry in self.entries.values())
+        if new_file != old_file and not still_used and not os.path.exists(old_entry["path"]):
+            (self.metadata_dir / old_file).unlink(missing_ok=True)
+
+    def add(self, video_path, digest, metadata_file):
+        stat = os.stat(video_path)
+        path = str(Path(video_path).resolve())
+        with self._lock:
+            # An older version of the same file is superseded
+            for old_digest in [d for d, e in self.entries.items() if e["path"] == path and d != digest]:
+                del self.entries[old_digest]
+            self.entries[digest] = {
+                "path": path,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "metadata_file": os.path.basename(metadata_file),
+                "version": self.version,
+                "indexed_at": datetime.now().isoformat(),
+            }
+            self._save()
+
+    def prune(self, directory, video_files):
+        """Drop entries (and their metadata files) for clips under directory that are no longer in video_files."""
+        root = Path(directory).resolve()
+        live = {str(Path(p).resolve()) for p in video_files}
+        removed = []
+        with self._lock:
+            for digest, entry in list(self.entries.items()):
+                if Path(entry["path"]).parent == root and entry["path"] not in live:
+                    del self.entries[digest]
+                    removed.append(entry)
+            shared = {entry["metadata_file"] for entry in self.entries.values()}
+            for entry in removed:
+                metadata_path = self.metadata_dir / entry["metadata_file"]
+                if entry["metadata_file"] not in shared and metadata_path.exists():
+                    metadata_path.unlink()
+            if removed:
+                self._save()
+        return len(removed)
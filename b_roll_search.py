@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+import numpy as np
+from pathlib import Path
+from semantic_cache import HashingEmbedder
+
+
+class BRollSearchIndex:
+    """Local embedding index over B-roll metadata for picking candidate shots without an LLM.
+
+    Each clip's VideoMetadata fields are embedded separately and a clip's score for a query is the
+    weighted sum of the field similarities; with several queries (product description, LoRA image
+    descriptions) a clip keeps its best score. Vectors are rebuilt only for metadata files that
+    changed since the last refresh.
+    """
+
+    FIELD_WEIGHTS = {
+        'video_description': 1.0,
+        'aesthetics_and_vibe_of_scene': 0.8,
+        'objects_in_video': 0.6,
+        'fashion_aesthetics_of_humans': 0.4,
+    }
+
+    def __init__(self, metadata_dir="b_roll_metadata", b_roll_dir="b_roll_cut", embed_fn=None, field_weights=None):
+        self.metadata_dir = Path(metadata_dir)
+        self.b_roll_dir = Path(b_roll_dir)
+        self.embed_fn = embed_fn or HashingEmbedder(dim=512)
+        self.field_weights = field_weights or self.FIELD_WEIGHTS
+        # metadata file name -> (mtime, video path, metadata, {field: vector})
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _video_paths(self):
+        """Map metadata file names to clip paths, preferring the B-roll index manifest when present."""
+        paths = {}
+        manifest = self.metadata_dir.with_name(f"{self.metadata_dir.name}_index.json")
+        if manifest.exists():
+            with open(manifest, 'r') as f:
+                for entry in json.load(f).get("entries", {}).values():
+                    paths[entry["metadata_file"]] = entry["path"]
+        return paths
+
+    @staticmethod
+    def _field_text(value):
+        if isinstance(value, list):
+            return ", ".join(str(v) for v in value)
+        return str(value or "")
+
+    def refresh(self):
+        if not self.metadata_dir.is_dir():
+            return
+        video_paths = self._video_paths()
+        current = {}
+        for metadata_path in self.metadata_dir.glob('*_metadata.json'):
+            mtime = metadata_path.stat().st_mtime
+            cached = self._entries.get(metadata_path.name)
+            if cached and cached[0] == mtime:
+                current[metadata_path.name] = cached
+                continue
+            try:
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping unreadable B-roll metadata {metadata_path}: {str(e)}")
+                continue
+            stem = metadata_path.name[:-len('_metadata.json')]
+            video_path = video_paths.get(metadata_path.name) or str((self.b_roll_dir / f"{stem}.mp4").resolve())
+            fields = [field for field in self.field_weights if metadata.get(field)]
+            vectors = self.embed_fn([self._field_text(metadata[field]) for field in fields]) if fields else []
+            current[metadata_path.name] = (mtime, video_path, metadata, dict(zip(fields, vectors)))
+        with self._lock:
+            self._entries = current
+
+    def search(self, queries, k=10):
+        """Return the top-k clips as (video_path, metadata, score), best first.
+
+        With no non-empty query there is nothing to rank by, so the first k clips by path are returned
+        with a score of 0.0 rather than none at all.
+        """
+        queries = [q for q in queries if q]
+        self.refresh()
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if os.path.exists(entry[1])]
+        if not entries:
+            return []
+        if not queries:
+            entries.sort(key=lambda entry: entry[1])
+            return [(video_path, metadata, 0.0) for _, video_path, metadata, _ in entries[:k]]
+
+        query_vectors = self.embed_fn(queries)
+        total_weight = sum(self.field_weights.values())
+        scored = []
+        for _, video_path, metadata, vectors in entries:
+            # Weighted field similarity per query, then the best query
+            per_query = np.zeros(len(queries))
+            for field, vector in vectors.items():
+                per_query += self.field_weights[field] * (query_vectors @ vector)
+            scored.append((video_path, metadata, float(per_query.max()) / total_weight))
+        scored.sort(key=lambda item: item[2], reverse=True)
+        return scored[:k]
@@ -0,0 +1,64 @@
+import re
+import json
+import time
+import random
+from json_stream import extract_json
+
+def legacy_to_json(output):
+    # The regex cascade LLM.to_json used before json_stream, kept here for comparison
+    try:
+        return json.loads(output)
+    except json.JSONDecodeError:
+        pass
+    matches = re.findall(r"```(.*?)```", output, re.DOTALL)
+    if matches:
+        try:
+            return json.loads(matches[0])
+        except json.JSONDecodeError:
+            pass
+    json_objects = []
+    for match in re.findall(r"\{.*?\}", output, re.DOTALL):
+        try:
+            json_objects.append(json.loads(match))
+        except json.JSONDecodeError:
+            pass
+    if json_objects:
+        return json_objects
+    match = re.compile(r'\{.*\}|\[.*\]', re.DOTALL).search(output)
+    if match:
+        try:
+            return json.loads(match.group())
+        except json.JSONDecodeError:
+            pass
+    return None
+
+def make_cases(size):
+    random.seed(0)
+    words = ["product", "category", "shoes", "pants", "{", "[", "note:", "value", "}", "\n"]
+    prose = " ".join(random.choice(words[:4] + ["\n"]) for _ in range(size // 6))
+    obj = json.dumps({"video_sequence": [f"/videos/clip_{i}.mp4" for i in range(size // 40)]})
+    return {
+        "valid json": obj,
+        "fenced block": f"Here is the script:\n```json\n{obj}\n```\nLet me know!",
+        "prose around object": f"{prose}\n{obj}\n{prose}",
+        "many small objects": " ".join(json.dumps({"id": i, "name": f"item {i}"}) + " and" for i in range(size // 30)),
+        "unclosed braces": prose + " {" * (size // 200) + prose,
+        "truncated output": obj[: len(obj) // 2] + " " + prose,
+    }
+
+def bench(fn, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    for size in (10_000, 100_000, 400_000):
+        print(f"\nOutput size ~{size} chars")
+        print(f"{'case':<22}{'legacy (ms)':>14}{'stream (ms)':>14}")
+        for name, text in make_cases(size).items():
+            legacy = bench(legacy_to_json, text)
+            stream = bench(extract_json, text)
+            print(f"{name:<22}{legacy * 1000:>14.2f}{stream * 1000:>14.2f}")
@@ -1,13 +1,16 @@
 import os
-import requests
 import fal_client
 from dotenv import load_dotenv
+from result_cache import ResultCache
+from http_transport import HTTPTransport
 
 class FalLoraInference:
-    def __init__(self):
+    def __init__(self, cache=None, http=None):
         load_dotenv()
         self.fal_key = os.getenv('FAL_KEY')
         fal_client.api_key = self.fal_key
+        self.cache = cache or ResultCache.default()
+        self.http = http or HTTPTransport.default()
 
     def on_queue_update(self, update):
         if isinstance(update, fal_client.InProgress):
@@ -33,19 +36,27 @@ class FalLoraInference:
         return result
 
     def download_image(self, image_url, output_path):
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+        try:
+            self.http.download(image_url, output_path)
             print(f"Image downloaded and saved to {output_path}")
-        else:
-            print(f"Failed to download image. Status code: {response.status_code}")
+        except Exception as e:
+            print(f"Failed to download image. {e}")
+
+    def run_inference(self, prompt, lora_path, output_path, use_cache=True):
+        cache_key = self.cache.make_key("fal", "fal-ai/flux-lora", {"prompt": prompt, "lora_path": lora_path, "scale": 1})
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached:
+                print(f"Cache hit. Restoring image to {output_path}")
+                self.cache.restore(cached, [output_path])
+                return cached["result"]
 
-    def run_inference(self, prompt, lora_path, output_path):
         result = self.generate_image(prompt, lora_path)
         if 'images' in result and len(result['images']) > 0:
             image_url = result['images'][0]['url']
             self.download_image(image_url, output_path)
+            if use_cache and os.path.exists(output_path):
+                self.cache.put(cache_key, [output_path], result)
             return result
         else:
             print("No image generated in the result.")
@@ -0,0 +1,209 @@
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+
+
+class FFmpegError(RuntimeError):
+    pass
+
+
+class FFmpegStitcher:
+    """Concatenate clips with a single ffmpeg filter graph instead of compositing frames in moviepy."""
+
+    def __init__(self, target_size=(1080, 1920), fps=30, video_codec="libx264", audio_codec="aac",
+                 preset="veryfast", crf=20, ffmpeg_path=None, ffprobe_path=None):
+        self.target_size = target_size
+        self.fps = fps
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+        self.preset = preset
+        self.crf = crf
+        self.ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+        self.ffprobe_path = ffprobe_path or shutil.which("ffprobe")
+
+    def is_available(self):
+        return bool(self.ffmpeg_path and self.ffprobe_path)
+
+    def _run(self, cmd):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise FFmpegError(f"{os.path.basename(cmd[0])} failed ({result.returncode}): {result.stderr[-2000:]}")
+        return result.stdout
+
+    def get_duration(self, path):
+        output = self._run([
+            self.ffprobe_path, "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "json", path
+        ])
+        return float(json.loads(output)["format"]["duration"])
+
+    def probe(self, path):
+        """Return the stream properties that must match for a stream-copy concat."""
+        output = self._run([
+            self.ffprobe_path, "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name,width,height,r_frame_rate,time_base,pix_fmt",
+            "-of", "json", path
+        ])
+        streams = json.loads(output).get("streams", [])
+        if not streams:
+            raise FFmpegError(f"No video stream found in {path}")
+        return streams[0]
+
+    def probe_audio(self, path):
+        """Return the first audio stream's properties, or None for a silent clip."""
+        output = self._run([
+            self.ffprobe_path, "-v", "error",
+            "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name,sample_rate,channels,channel_layout",
+            "-of", "json", path
+        ])
+        streams = json.loads(output).get("streams", [])
+        return streams[0] if streams else None
+
+    def can_stream_copy(self, video_paths, target_size=None, audio_path=None):
+        """Check whether all clips share codec, resolution, fps and timebase (and optionally a target size).
+
+        Without a soundtrack the clips' own audio is copied too, so their audio streams must match as well.
+        """
+        if not self.is_available() or not video_paths:
+            return False
+        try:
+            probes = [self.probe(path) for path in video_paths]
+            if not audio_path:
+                for path, probe in zip(video_paths, probes):
+                    probe["audio"] = self.probe_audio(path)
+        except FFmpegError as e:
+            print(f"Probe failed, re-encoding instead: {str(e)}")
+            return False
+
+        first = probes[0]
+        if target_size and (first.get("width"), first.get("height")) != tuple(target_size):
+            return False
+        return all(p == first for p in probes[1:])
+
+    def concat_copy(self, video_paths, output_path, audio_path=None):
+        """Concat clips with the concat demuxer and stream copy, only muxing in the audio track."""
+        if not self.is_available():
+            raise FFmpegError("ffmpeg/ffprobe not found on PATH")
+        if not video_paths:
+            raise ValueError("No video paths provided")
+
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+            for path in video_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                list_file.write(f"file '{escaped}'\n")
+            list_path = list_file.name
+
+        try:
+            cmd = [self.ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error",
+                   "-f", "concat", "-safe", "0", "-i", list_path]
+            if audio_path:
+                # Limit the audio input to the video length so the soundtrack is trimmed, not the video
+                total_duration = sum(self.get_duration(path) for path in video_paths)
+                cmd += ["-t", f"{total_duration:.3f}", "-i", audio_path]
+                cmd += ["-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", self.audio_codec]
+            else:
+                cmd += ["-map", "0:v", "-map", "0:a?", "-c", "copy"]
+            cmd += ["-movflags", "+faststart", output_path]
+
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            print(f"Concatenating {len(video_paths)} clips with stream copy into {output_path}...")
+            self._run(cmd)
+        finally:
+            os.remove(list_path)
+        return output_path
+
+    def build_filter_graph(self, num_videos, audio_index=None, total_duration=None, clip_audio=None):
+        """Scale and pad every input to the target size, concat them, and trim the audio track to the video length.
+
+        Without a soundtrack, clip_audio lists (has_audio, duration) per input: the clips' own audio is
+        concatenated alongside the video, with silence of the clip's length for inputs that have none.
+        """
+        width, height = self.target_size
+        filters = []
+        for i in range(num_videos):
+            filters.append(
+                f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black,"
+                f"setsar=1,fps={self.fps},format=yuv420p[v{i}]"
+            )
+        if audio_index is None and clip_audio:
+            for i, (has_audio, duration) in enumerate(clip_audio):
+                # Pad or cut every track to its clip's length so audio stays in sync across the cuts
+                source = f"[{i}:a]" if has_audio else "anullsrc=channel_layout=stereo:sample_rate=44100,"
+                filters.append(
+                    f"{source}aformat=sample_rates=44100:channel_layouts=stereo,"
+                    f"apad,atrim=end={duration:.3f},asetpts=PTS-STARTPTS[a{i}]"
+                )
+            concat_inputs = "".join(f"[v{i}][a{i}]" for i in range(num_videos))
+            filters.append(f"{concat_inputs}concat=n={num_videos}:v=1:a=1[vout][aout]")
+            return ";".join(filters)
+
+        concat_inputs = "".join(f"[v{i}]" for i in range(num_videos))
+        filters.append(f"{concat_inputs}concat=n={num_videos}:v=1:a=0[vout]")
+
+        if audio_index is not None:
+            trim = f"atrim=end={total_duration:.3f}," if total_duration else ""
+            filters.append(f"[{audio_index}:a]{trim}asetpts=PTS-STARTPTS[aout]")
+
+        return ";".join(filters)
+
+    def stitch(self, video_paths, output_path, audio_path=None, allow_copy=True):
+        if not self.is_available():
+            raise FFmpegError("ffmpeg/ffprobe not found on PATH")
+        if not video_paths:
+            raise ValueError("No video paths provided")
+
+        # Clips that already match each other and the target size don't need scaling or re-encoding
+        if allow_copy and self.can_stream_copy(video_paths, self.target_size, audio_path):
+            try:
+                return self.concat_copy(video_paths, output_path, audio_path)
+            except FFmpegError as e:
+                print(f"ffmpeg stream copy failed, re-encoding instead: {str(e)}")
+
+        cmd = [self.ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error"]
+        for path in video_paths:
+            cmd += ["-i", path]
+
+        audio_index = None
+        total_duration = None
+        clip_audio = None
+        if audio_path:
+            audio_index = len(video_paths)
+            cmd += ["-i", audio_path]
+            total_duration = sum(self.get_duration(path) for path in video_paths)
+        else:
+            # No soundtrack: keep the clips' own audio, as moviepy's concatenate does
+            clip_audio = [(self.probe_audio(path) is not None, self.get_duration(path)) for path in video_paths]
+            if not any(has_audio for has_audio, _ in clip_audio):
+                clip_audio = None
+
+        cmd += ["-filter_complex", self.build_filter_graph(len(video_paths), audio_index, total_duration, clip_audio)]
+        cmd += ["-map", "[vout]"]
+        if audio_index is not None or clip_audio:
+            cmd += ["-map", "[aout]", "-c:a", self.audio_codec]
+        cmd += [
+            "-c:v", self.video_codec,
+            "-preset", self.preset,
+            "-crf", str(self.crf),
+            "-movflags", "+faststart",
+            output_path
+        ]
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        print(f"Stitching {len(video_paths)} clips with ffmpeg into {output_path}...")
+        self._run(cmd)
+        return output_path
+
+# Example usage
+if __name__ == "__main__":
+    stitcher = FFmpegStitcher()
+    stitcher.stitch(
+        ["gen_video/clip1.mp4", "gen_video/clip2.mp4"],
+        "gen_video/stitched.mp4",
+        audio_path="generated_songs/song.mp3"
+    )
@@ -1,13 +1,23 @@
 import os
 import time
-import requests
 from dotenv import load_dotenv
 import sys
 from PIL import Image
+from result_cache import ResultCache
+from webhook_receiver import WebhookReceiver
+from http_transport import HTTPTransport
 
 class FluxImageGenerator:
-    def __init__(self):
+    def __init__(self, cache=None, webhook_url=None, webhook_port=8765, poll_timeout=300, http=None):
         self.api_key = self._load_api_key()
+        self.cache = cache or ResultCache.default()
+        self.http = http or HTTPTransport.default()
+        self.headers = {"Authorization": f"Bearer {self.api_key}"}
+        self.poll_timeout = poll_timeout
+        # Webhook mode: Replicate pushes completion to a local receiver reachable at webhook_url.
+        # Deliveries are verified with REPLICATE_WEBHOOK_SECRET; the receiver is shared per port
+        self.webhook_url = webhook_url or os.getenv('FLUX_WEBHOOK_URL')
+        self.webhook_receiver = WebhookReceiver.shared(port=webhook_port) if self.webhook_url else None
 
     def _load_api_key(self):
         """Load the Replicate API key from the .env file."""
@@ -20,11 +30,6 @@ class FluxImageGenerator:
     def _create_prediction(self, prompt, origin_image=None, steps=25, guidance=3, interval=2, output_format="webp", output_quality=80, safety_tolerance=2):
         """Create a new prediction using the Replicate API with additional parameters."""
         url = "https://api.replicate.com/v1/models/black-forest-labs/flux-pro/predictions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "input": {
                 "prompt": prompt,
@@ -37,42 +42,82 @@ class FluxImageGenerator:
                 "safety_tolerance": safety_tolerance
             }
         }
-        response = requests.post(url, headers=headers, json=payload)
+        if self.webhook_url:
+            payload["webhook"] = self.webhook_url
+            payload["webhook_events_filter"] = ["completed"]
+        response = self.http.post(url, headers=self.headers, json=payload)
         if response.status_code != 201:
             raise RuntimeError(f"Error creating prediction: {response.status_code} - {response.text}")
         prediction = response.json()
         return prediction.get('urls', {}).get('get')
 
-    def _poll_prediction(self, prediction_url):
-        """Poll the prediction URL until the prediction is complete."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        while True:
-            response = requests.get(prediction_url, headers=headers)
-            if response.status_code != 200:
-                raise RuntimeError(f"Error polling prediction: {response.status_code} - {response.text}")
-            prediction = response.json()
-            status = prediction.get('status')
-            print(f"Prediction status: {status}")
-            if status == "succeeded":
-                return prediction.get('output')
-            elif status in ["failed", "canceled"]:
-                raise RuntimeError(f"Prediction {status}. {response.text}")
-            time.sleep(5)
+    def _check_prediction(self, prediction):
+        status = prediction.get('status')
+        if status == "succeeded":
+            return True
+        elif status in ["failed", "canceled"]:
+            raise RuntimeError(f"Prediction {status}. {prediction.get('error')}")
+        return False
+
+    def _poll_prediction(self, prediction_url, initial_interval=0.5, max_interval=5, backoff=1.5, timeout=None):
+        """Poll the prediction URL until the prediction is complete.
+
+        Starts with a short interval so fast predictions return quickly, backs off towards
+        max_interval for long ones, and gives up after timeout seconds. In webhook mode the
+        wait between polls ends early as soon as the completion webhook arrives.
+        """
+        timeout = timeout or self.poll_timeout
+        deadline = time.time() + timeout
+        prediction_id = prediction_url.rstrip('/').rsplit('/', 1)[-1]
+        if self.webhook_receiver:
+            self.webhook_receiver.expect(prediction_id)
+        interval = initial_interval
+        last_status = None
+        try:
+            while True:
+                response = self.http.get(prediction_url, headers=self.headers)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Error polling prediction: {response.status_code} - {response.text}")
+                prediction = response.json()
+                status = prediction.get('status')
+                if status != last_status:
+                    print(f"Prediction status: {status}")
+                    last_status = status
+                if self._check_prediction(prediction):
+                    return prediction.get('output')
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"Prediction {prediction_id} did not finish within {timeout} seconds")
+                wait = min(interval, remaining)
+                if self.webhook_receiver:
+                    # With webhooks, polling is only a fallback in case delivery fails
+                    pushed = self.webhook_receiver.wait(prediction_id, timeout=min(max_interval, remaining))
+                    if pushed and self._check_prediction(pushed):
+                        return pushed.get('output')
+                else:
+                    time.sleep(wait)
+                interval = min(interval * backoff, max_interval)
+        finally:
+            if self.webhook_receiver:
+                self.webhook_receiver.discard(prediction_id)
 
     def _download_image(self, image_url, output_path="output_image.png"):
         """Download the generated image from the provided URL."""
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            print(f"Image downloaded successfully and saved to {output_path}")
-        else:
-            raise RuntimeError(f"Error downloading image: {response.status_code} - {response.text}")
+        self.http.download(image_url, output_path)
+        print(f"Image downloaded successfully and saved to {output_path}")
 
-    def generate_image(self, prompt, origin_image=None, output_path="output_image.png"):
+    def generate_image(self, prompt, origin_image=None, output_path="output_image.png", use_cache=True):
         """Generate an image based on the given prompt and origin image, and save it to the specified path."""
+        input_files = [origin_image] if origin_image and os.path.isfile(origin_image) else []
+        cache_key = self.cache.make_key("replicate", "black-forest-labs/flux-pro", {"prompt": prompt, "origin_image": origin_image if not input_files else None}, input_files)
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached:
+                print(f"Cache hit. Restoring image to {output_path}")
+                self.cache.restore(cached, [output_path])
+                return output_path
+
         print("Creating prediction...")
         prediction_url = self._create_prediction(prompt, origin_image)
         if not prediction_url:
@@ -90,6 +135,8 @@ class FluxImageGenerator:
 
         print(f"Downloading image from {image_url}...")
         self._download_image(image_url, output_path)
+        if use_cache:
+            self.cache.put(cache_key, [output_path], {"image_url": image_url})
         return output_path
 
 def main():
@@ -1,15 +1,18 @@
 import os
 import json
-from datetime import datetime
 from pathlib import Path
 import google.generativeai as genai
 from dotenv import load_dotenv
 import time
 import typing_extensions as typing
 import concurrent.futures
+import threading
 from moviepy.editor import VideoFileClip
-from PIL import Image
 import numpy as np
+from image_bytes import encode_image
+from b_roll_index import BRollIndex
+from scene_detect import SceneDetector
+import hashlib
 
 class VideoMetadata(typing.TypedDict):
     video_description: str
@@ -18,94 +21,310 @@ class VideoMetadata(typing.TypedDict):
     fashion_aesthetics_of_humans: list[str]
     aesthetics_and_vibe_of_scene: str
 
+class ShotMetadata(typing.TypedDict):
+    start_time: float
+    end_time: float
+    shot_description: str
+    camera_movement: str
+
+class KeyframeVideoMetadata(typing.TypedDict):
+    video_description: str
+    objects_in_video: list[str]
+    humans_in_video: list[str]
+    fashion_aesthetics_of_humans: list[str]
+    aesthetics_and_vibe_of_scene: str
+    shots: list[ShotMetadata]
+
+class ImageDescription(typing.TypedDict):
+    image_index: int
+    description: str
+
 class GeminiDescriber:
-    def __init__(self):
+    VIDEO_MODEL = "gemini-1.5-pro-002"
+    VIDEO_PROMPT = '''
+        Describe this video in detail.  
+        Capture the camera movements, lighting, and any other details.
+        Identify and label the objects in the video.
+        If there are humans, describe their clothing, aesthetic, appearance, and actions.
+        Output the aesthetics and vibe of the video.
+        '''
+    IMAGE_MODEL = "gemini-1.5-flash"
+    IMAGE_PROMPT = "Describe this image in detail. Focus on the subject, composition, colors, and overall aesthetic. Give concise output."
+    # Inline requests are limited to about 20 MB after base64 encoding; leave headroom for the prompt
+    MAX_INLINE_BYTES = 18 * 1024 * 1024
+    KEYFRAME_PROMPT = '''
+        These are keyframes sampled from the shots of one video clip, in order, each labelled with its shot and timestamp.
+        Describe the video in detail as a whole.
+        Infer the camera movements from how the frames of each shot change, and describe the lighting and any other details.
+        Identify and label the objects in the video.
+        If there are humans, describe their clothing, aesthetic, appearance, and actions.
+        Output the aesthetics and vibe of the video, and one entry per shot using the given start and end times.
+        '''
+
+    def __init__(self, describe_mode: str = None, scene_detector: SceneDetector = None):
         load_dotenv()
         api_key = os.getenv('GEMINI_API_KEY')
         genai.configure(api_key=api_key)
-        self.video_model = genai.GenerativeModel(model_name="gemini-1.5-pro-002")
-        self.image_model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+        self.video_model = genai.GenerativeModel(model_name=self.VIDEO_MODEL)
+        self.image_model = genai.GenerativeModel(model_name=self.IMAGE_MODEL)
         self.output_dir = None
+        self.index = None
+        # "video" uploads whole clips to the video model; "keyframes" sends locally sampled shot keyframes to the image model
+        self.describe_mode = describe_mode or os.getenv('B_ROLL_DESCRIBE_MODE', 'video')
+        self.scene_detector = scene_detector or SceneDetector()
 
-    def describe_video(self, video_path: str) -> VideoMetadata:
-        print(f"Uploading file...")
+    def _upload_video(self, video_path: str):
+        print(f"Uploading {Path(video_path).name}...")
         video_file = genai.upload_file(path=video_path)
         print(f"Completed upload: {video_file.uri}")
+        return video_file
 
+    def _infer_video(self, video_file) -> str:
+        print(f"Making LLM inference request for {video_file.name}...")
+        response = self.video_model.generate_content(
+            [video_file, self.VIDEO_PROMPT],
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=VideoMetadata
+            ),
+            request_options={"timeout": 600}
+        )
+        return response.text
+
+    def describe_video(self, video_path: str, min_interval: float = 1, max_interval: float = 10) -> VideoMetadata:
+        video_file = self._upload_video(video_path)
+
+        interval = min_interval
         while video_file.state.name == "PROCESSING":
             print('.', end='', flush=True)
-            time.sleep(10)
+            time.sleep(interval)
+            interval = min(interval * 1.5, max_interval)
             video_file = genai.get_file(video_file.name)
 
         if video_file.state.name == "FAILED":
             raise ValueError(f"Video processing failed: {video_file.state.name}")
 
-        prompt = '''
-        Describe this video in detail.  
-        Capture the camera movements, lighting, and any other details.
-        Identify and label the objects in the video.
-        If there are humans, describe their clothing, aesthetic, appearance, and actions.
-        Output the aesthetics and vibe of the video.
-        '''
+        return self._infer_video(video_file)
+
+    def describe_videos_pipelined(self, video_paths, on_result=None, upload_workers: int = 4, inference_workers: int = 5,
+                                  max_in_flight: int = 10, min_interval: float = 1, max_interval: float = 10,
+                                  processing_timeout: float = 600, max_status_errors: int = 5) -> dict:
+        """Describe many videos with uploads, processing-state polling and inference as separate stages.
+
+        Uploads run on their own bounded pool, one loop polls every file still in PROCESSING with an
+        adaptive interval, and active files go to an inference pool with its own limit, so later
+        uploads overlap with inference on earlier clips. max_in_flight caps how many uploaded files
+        wait for inference at once. A file that is still processing after processing_timeout seconds,
+        or whose state check fails max_status_errors times in a row, is given up on and deleted like
+        a FAILED one. on_result(video_path, metadata) is called from the inference pool as each clip
+        finishes. Returns {video_path: metadata} for the clips that succeeded.
+        """
+        results = {}
+        slots = threading.Semaphore(max_in_flight)
+
+        def upload(video_path):
+            slots.acquire()
+            try:
+                return self._upload_video(str(video_path))
+            except Exception:
+                slots.release()
+                raise
+
+        def discard(video_path, video_file, reason):
+            slots.release()
+            print(f"Error processing {video_path}: {reason}")
+            try:
+                genai.delete_file(video_file.name)
+            except Exception as e:
+                print(f"Could not delete uploaded file {video_file.name}: {e}")
+
+        def infer(video_path, video_file):
+            try:
+                metadata = self._infer_video(video_file)
+                if on_result:
+                    on_result(video_path, metadata)
+                results[video_path] = metadata
+            finally:
+                slots.release()
+                try:
+                    genai.delete_file(video_file.name)
+                except Exception as e:
+                    print(f"Could not delete uploaded file {video_file.name}: {e}")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=upload_workers) as upload_pool, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=inference_workers) as inference_pool:
+            uploads = {upload_pool.submit(upload, path): path for path in video_paths}
+            inferences = {}
+            processing = {}
+            # video_path -> (processing deadline, consecutive state-check errors)
+            polls = {}
+            interval = min_interval
+
+            while uploads or processing:
+                for future in [f for f in uploads if f.done()]:
+                    video_path = uploads.pop(future)
+                    try:
+                        processing[video_path] = future.result()
+                        polls[video_path] = (time.time() + processing_timeout, 0)
+                        # A fresh upload usually becomes active quickly, so check it again soon
+                        interval = min_interval
+                    except Exception as e:
+                        print(f"Error uploading {video_path}: {str(e)}")
+
+                for video_path, video_file in list(processing.items()):
+                    deadline, errors = polls[video_path]
+                    if video_file.state.name == "PROCESSING":
+                        try:
+                            video_file = processing[video_path] = genai.get_file(video_file.name)
+                            polls[video_path] = (deadline, 0)
+                        except Exception as e:
+                            print(f"Error checking state of {video_path}: {str(e)}")
+                            polls[video_path] = (deadline, errors + 1)
+                            if errors + 1 >= max_status_errors:
+                                del processing[video_path]
+                                discard(video_path, video_file, f"giving up after {errors + 1} failed state checks")
+                            continue
+                    if video_file.state.name == "PROCESSING":
+                        if time.time() > deadline:
+                            del processing[video_path]
+                            discard(video_path, video_file, f"still processing after {processing_timeout}s")
+                        continue
+                    del processing[video_path]
+                    if video_file.state.name == "FAILED":
+                        discard(video_path, video_file, "video processing failed")
+                    else:
+                        inferences[inference_pool.submit(infer, video_path, video_file)] = video_path
+
+                if uploads:
+                    concurrent.futures.wait(list(uploads), timeout=interval, return_when=concurrent.futures.FIRST_COMPLETED)
+                elif processing:
+                    time.sleep(interval)
+                interval = min(interval * 1.5, max_interval)
+
+            for future in concurrent.futures.as_completed(inferences):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error processing {inferences[future]}: {str(e)}")
+
+        return results
+
+    def describe_video_keyframes(self, video_path: str) -> KeyframeVideoMetadata:
+        """Describe a clip from keyframes of its detected shots in one multi-image request."""
+        shots = self.scene_detector.detect(video_path)
+        print(f"Detected {len(shots)} shots in {Path(video_path).name}")
+
+        content = [self.KEYFRAME_PROMPT]
+        for i, shot in enumerate(shots):
+            content.append(f"Shot {i + 1}: {shot['start']:.2f}s to {shot['end']:.2f}s")
+            for timestamp, frame in shot['keyframes']:
+                content.append(f"Frame at {timestamp:.2f}s:")
+                content.append(encode_image(frame, "JPEG", 85).as_part())
 
         print("Making LLM inference request...")
-        response = self.video_model.generate_content(
-            [video_file, prompt],
+        response = self.image_model.generate_content(
+            content,
             generation_config=genai.GenerationConfig(
                 response_mime_type="application/json",
-                response_schema=VideoMetadata
+                response_schema=KeyframeVideoMetadata
             ),
             request_options={"timeout": 600}
         )
-
         return response.text
 
-    def describe_image(self, image: np.ndarray) -> str:
-        # Convert numpy array to PIL Image
-        pil_image = Image.fromarray(image)
+    def describe_image(self, image: np.ndarray, image_format="JPEG", quality=90) -> str:
+        # Encode in memory and send the bytes inline; no temp file and no File API upload round trip
+        encoded = encode_image(image, image_format, quality)
 
-        # Save the image to a temporary file
-        temp_file = "temp_image.jpg"
-        pil_image.save(temp_file)
+        response = self.image_model.generate_content([encoded.as_part(), self.IMAGE_PROMPT])
 
-        # Upload the image file
-        image_file = genai.upload_file(path=temp_file)
-        
-        while image_file.state.name == "PROCESSING":
-            print('.', end='', flush=True)
-            time.sleep(10)
-            image_file = genai.get_file(image_file.name)
+        return response.text
 
-        if image_file.state.name == "FAILED":
-            raise ValueError(f"Image processing failed: {image_file.state.name}")
+    def _describe_image_batch(self, batch: list) -> dict:
+        """Describe several (index, EncodedImage) pairs in one structured request; returns {index: description}."""
+        content = [f"{self.IMAGE_PROMPT} Describe each of the following {len(batch)} images separately, "
+                   "returning one entry per image with its image_index."]
+        for index, encoded in batch:
+            content.append(f"Image {index}:")
+            content.append(encoded.as_part())
 
-        prompt = "Describe this image in detail. Focus on the subject, composition, colors, and overall aesthetic. Give concise output."
+        response = self.image_model.generate_content(
+            content,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=list[ImageDescription]
+            )
+        )
+        wanted = {index for index, _ in batch}
+        return {item["image_index"]: item["description"] for item in json.loads(response.text)
+                if item.get("image_index") in wanted and item.get("description")}
 
-        response = self.image_model.generate_content([image_file, prompt])
+    def describe_lora_outputs(self, lora_outputs: list[np.ndarray], batch: bool = True, max_workers: int = 5) -> list[str]:
+        """Describe the LoRA images, keeping None for empty slots.
 
-        # Remove the temporary file
-        os.remove(temp_file)
+        In batch mode the images are sent inline in as few requests as the inline size limit allows.
+        Any image a batch fails to cover is described on its own, concurrently.
+        """
+        encoded = {i: encode_image(image) for i, image in enumerate(lora_outputs) if image is not None}
+        descriptions = {}
 
-        return response.text
+        if batch and len(encoded) > 1:
+            batches, current, size = [], [], 0
+            for index, image in encoded.items():
+                # Budget by the base64-encoded size, which is what counts against the limit
+                image_size = (len(image.data) + 2) // 3 * 4
+                if current and size + image_size > self.MAX_INLINE_BYTES:
+                    batches.append(current)
+                    current, size = [], 0
+                current.append((index, image))
+                size += image_size
+            batches.append(current)
 
-    def describe_lora_outputs(self, lora_outputs: list[np.ndarray]) -> list[str]:
-        descriptions = []
-        for image in lora_outputs:
-            if image is not None:
-                description = self.describe_image(image)
-                descriptions.append(description)
-            else:
-                descriptions.append(None)
-        return descriptions
+            for images in batches:
+                try:
+                    descriptions.update(self._describe_image_batch(images))
+                except Exception as e:
+                    print(f"Batched image description failed, falling back to single requests: {str(e)}")
+
+        missing = [index for index in encoded if index not in descriptions]
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self.describe_image, encoded[index]): index for index in missing}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        descriptions[futures[future]] = future.result()
+                    except Exception as e:
+                        # Leave the slot as None rather than losing every other description
+                        print(f"Error describing LoRA image {futures[future] + 1}: {str(e)}")
+
+        return [descriptions.get(i) for i in range(len(lora_outputs))]
 
     def get_video_duration(self, video_path: str) -> float:
         with VideoFileClip(video_path) as clip:
             return clip.duration
 
+    @property
+    def describer_version(self) -> str:
+        """Fingerprint of everything that shapes the metadata; changing any of it invalidates the B-roll index."""
+        if self.describe_mode == "keyframes":
+            spec = json.dumps({
+                "mode": "keyframes",
+                "model": self.IMAGE_MODEL,
+                "prompt": self.KEYFRAME_PROMPT,
+                "schema": sorted(KeyframeVideoMetadata.__annotations__),
+                "scene_detector": self.scene_detector.settings,
+            }, sort_keys=True)
+        else:
+            spec = json.dumps({
+                "model": self.VIDEO_MODEL,
+                "prompt": self.VIDEO_PROMPT,
+                "schema": sorted(VideoMetadata.__annotations__),
+            }, sort_keys=True)
+        return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
     def save_metadata(self, metadata: str, video_name: str, video_path: str):
         if self.output_dir is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.output_dir = Path(f"video_metadata_{timestamp}")
+            self.output_dir = Path("b_roll_metadata")
             self.output_dir.mkdir(exist_ok=True)
         
         metadata_dict = json.loads(metadata)
@@ -118,48 +337,66 @@ class GeminiDescriber:
         with open(file_name, 'w') as f:
             json.dump(metadata_dict, f, indent=2)
         print(f"Metadata saved to {file_name}")
+        return file_name
+
+    def _plan_directory(self, directory_path: str, output_dir: str, force: bool):
+        """Open the persistent index in output_dir and return the clips that need describing as (path, digest)."""
+        self.output_dir = Path(output_dir)
+        self.index = BRollIndex(self.output_dir, version=self.describer_version)
 
-    def process_directory(self, directory_path: str, max_workers: int = 5):
-        # Create output directory
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.output_dir = Path(f"video_metadata_{timestamp}")
-        self.output_dir.mkdir(exist_ok=True)
-        
         directory = Path(directory_path)
         video_files = list(directory.glob('*.mp4'))  # Adjust the extension if needed
-        
+
         print(f"Found {len(video_files)} video files in {directory_path}")
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.process_single_video, video_file): video_file for video_file in video_files}
-            
-            for future in concurrent.futures.as_completed(futures):
-                video_file = futures[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    print(f"Error processing {video_file}: {str(e)}")
 
-    def process_single_video(self, video_path: Path):
+        to_describe, reused = self.index.plan(video_files, force=force)
+        pruned = self.index.prune(directory, video_files)
+        print(f"{len(reused)} already indexed, {len(to_describe)} new or changed, {pruned} stale entries removed")
+        return to_describe
+
+    def process_directory(self, directory_path: str, max_workers: int = 5, output_dir: str = "b_roll_metadata", force: bool = False,
+                          upload_workers: int = 4):
+        to_describe = self._plan_directory(directory_path, output_dir, force)
+        digests = dict(to_describe)
+
+        if self.describe_mode == "keyframes":
+            # Nothing to upload or wait on; decoding and inference for each clip run together
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self.process_single_video, video_file, digest): video_file for video_file, digest in to_describe}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Error processing {futures[future]}: {str(e)}")
+            return
+
+        def on_result(video_path, metadata):
+            self._store_result(video_path, metadata, digests[video_path])
+
+        # max_workers bounds concurrent inference calls; uploads and polling run as their own stages
+        self.describe_videos_pipelined([video_file for video_file, _ in to_describe], on_result=on_result,
+                                       upload_workers=upload_workers, inference_workers=max_workers)
+
+    def process_single_video(self, video_path: Path, digest: str = None):
         print(f"Processing {video_path.name}...")
-        metadata = self.describe_video(str(video_path))
-        self.save_metadata(metadata, video_path.stem, str(video_path))
+        if self.describe_mode == "keyframes":
+            metadata = self.describe_video_keyframes(str(video_path))
+        else:
+            metadata = self.describe_video(str(video_path))
+        self._store_result(video_path, metadata, digest)
+
+    def _store_result(self, video_path: Path, metadata: str, digest: str = None):
+        metadata_file = self.save_metadata(metadata, video_path.stem, str(video_path))
+        if digest and self.index is not None:
+            self.index.add(video_path, digest, metadata_file)
         print(f"Completed processing {video_path.name}")
 
-    def process_directory_sequential(self, directory_path: str):
-        # Create output directory
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.output_dir = Path(f"video_metadata_{timestamp}")
-        self.output_dir.mkdir(exist_ok=True)
-        
-        directory = Path(directory_path)
-        video_files = list(directory.glob('*.mp4'))  # Adjust the extension if needed
-        
-        print(f"Found {len(video_files)} video files in {directory_path}")
+    def process_directory_sequential(self, directory_path: str, output_dir: str = "b_roll_metadata", force: bool = False):
+        to_describe = self._plan_directory(directory_path, output_dir, force)
         
-        for video_file in video_files:
+        for video_file, digest in to_describe:
             try:
-                self.process_single_video(video_file)
+                self.process_single_video(video_file, digest)
             except Exception as e:
                 print(f"Error processing {video_file}: {str(e)}")
 
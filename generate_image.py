@@ -2,9 +2,9 @@ import os
 import replicate
 from datetime import datetime
 from dotenv import load_dotenv
-import requests
 from urllib.parse import urlparse
 from img_bucket import GCPImageUploader
+from http_transport import HTTPTransport
 
 class ImageGenerator:
     def __init__(self):
@@ -14,6 +14,7 @@ class ImageGenerator:
             raise ValueError("REPLICATE_API_TOKEN is not set in the environment variables")
         self.client = replicate.Client(api_token=self.replicate_api_token)
         self.uploader = GCPImageUploader()
+        self.http = HTTPTransport.default()
 
     def generate_image(self, mask, input_image, prompt):
         mask_data = self._prepare_image(mask, "mask")
@@ -58,23 +59,18 @@ class ImageGenerator:
             return False
 
     def _download_and_save_image(self, image_url):
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"gen_image_{current_datetime}.png"
-            
-            os.makedirs('generated_img', exist_ok=True)
-            file_path = os.path.join('generated_img', filename)
-            
-            with open(file_path, 'wb') as file:
-                file.write(response.content)
-            
-            print(f"Image saved as {file_path}")
-            return file_path
-        else:
-            print("Failed to download the image")
+        current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"gen_image_{current_datetime}.png"
+        file_path = os.path.join('generated_img', filename)
+        try:
+            self.http.download(image_url, file_path)
+        except Exception as e:
+            print(f"Failed to download the image: {e}")
             return None
 
+        print(f"Image saved as {file_path}")
+        return file_path
+
 # Example usage:
 if __name__ == "__main__":
     generator = ImageGenerator()
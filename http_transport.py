@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import threading
+import concurrent.futures
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ProgressReporter:
+    """Thread-safe byte counter that calls callback(downloaded, total) at most every min_interval seconds."""
+
+    def __init__(self, callback=None, total=None, min_interval=0.5):
+        self.callback = callback
+        self.total = total
+        self.min_interval = min_interval
+        self.downloaded = 0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.downloaded += count
+            now = time.time()
+            if self.callback is None or now - self._last < self.min_interval:
+                return
+            self._last = now
+            downloaded = self.downloaded
+        self.callback(downloaded, self.total)
+
+    def finish(self):
+        if self.callback:
+            self.callback(self.downloaded, self.total)
+
+
+def print_progress(label):
+    """Progress callback that prints a percentage, or a byte count when the size is unknown."""
+    def callback(downloaded, total):
+        if total:
+            print(f"Download progress for {label}: {downloaded / total * 100:.2f}%", end='\r')
+        else:
+            print(f"Download progress for {label}: {downloaded / 1024 ** 2:.1f} MB", end='\r')
+    return callback
+
+
+class HTTPTransport:
+    """Shared, pooled HTTP session for API calls and artifact downloads.
+
+    One requests.Session per process keeps TCP/TLS connections alive across calls to the same host.
+    Downloads are streamed to disk in chunks and resumed with an HTTP Range request when a partial
+    file from an earlier attempt of the same URL is found.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, pool_connections=10, pool_maxsize=32, connect_timeout=10, read_timeout=120, max_retries=3,
+                 chunk_size=1024 * 1024):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls):
+        """Shared process-wide transport, configured from HTTP_POOL_MAXSIZE and HTTP_READ_TIMEOUT."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(
+                    pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", 32)),
+                    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", 120))
+                )
+            return cls._default
+
+    @property
+    def session(self):
+        with self._lock:
+            # Pooled sockets must not be shared with a forked child
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                # Connection errors and gateway failures only; callers decide how to handle API errors
+                retry = Retry(total=self.max_retries, connect=self.max_retries, read=0, backoff_factor=0.5,
+                              status_forcelist=(502, 503, 504), allowed_methods=frozenset(["GET", "HEAD"]))
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                                      max_retries=retry)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+                self._session_pid = os.getpid()
+            return self._session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @staticmethod
+    def _strong_validator(response):
+        """A validator usable in If-Range: a strong ETag, else Last-Modified."""
+        etag = response.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return response.headers.get("Last-Modified")
+
+    @staticmethod
+    def _read_state(state_path):
+        try:
+            with open(state_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def download(self, url, output_path, headers=None, resume=True, progress=None):
+        """Stream url to output_path without holding the body in memory.
+
+        Data is written to output_path + ".part" and renamed into place once complete. The URL and a
+        validator (strong ETag or Last-Modified) are recorded in a sidecar next to the part file; a
+        leftover part file is only resumed, with Range and If-Range, when it came from the same URL
+        and had a validator. Otherwise the download starts over.
+        """
+        part_path = f"{output_path}.part"
+        state_path = f"{part_path}.json"
+        state = self._read_state(state_path) if os.path.exists(state_path) else {}
+        # Part files from download_parallel are preallocated, not a contiguous prefix
+        if not (state.get("mode") == "stream" and state.get("url") == url and state.get("validator")):
+            resume = False
+        headers_arg = headers
+        headers = dict(headers or {})
+        offset = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = state["validator"]
+        reporter = progress if isinstance(progress, ProgressReporter) else ProgressReporter(progress)
+
+        with self.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 416:
+                # Only trust the part file as complete if its size matches the resource
+                total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+                if not (total.isdigit() and int(total) == offset):
+                    response.close()
+                    os.remove(part_path)
+                    os.remove(state_path)
+                    return self.download(url, output_path, headers=headers_arg, resume=False, progress=progress)
+                response.close()
+            elif response.status_code not in (200, 206):
+                raise RuntimeError(f"Failed to download {url}: HTTP {response.status_code}")
+            else:
+                # A 200 means the server ignored the Range header or the file changed, so start over
+                mode = "ab" if response.status_code == 206 else "wb"
+                length = response.headers.get("Content-Length")
+                if reporter.total is None and length:
+                    reporter.total = int(length) + (offset if mode == "ab" else 0)
+                if mode == "ab":
+                    reporter.add(offset)
+                directory = os.path.dirname(output_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if mode == "wb":
+                    with open(state_path, "w") as f:
+                        json.dump({"mode": "stream", "url": url, "validator": self._strong_validator(response)}, f)
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            reporter.add(len(chunk))
+
+        reporter.finish()
+        os.replace(part_path, output_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return output_path
+
+    def probe(self, url, headers=None):
+        """Return (size, validator, accepts_ranges) for url.
+
+        size is None when the server doesn't say; validator is a strong ETag or Last-Modified, or None.
+        """
+        headers = {**(headers or {}), "Range": "bytes=0-0"}
+        with self.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 206:
+                content_range = response.headers.get("Content-Range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                size = int(total) if total.isdigit() else None
+                return size, self._strong_validator(response), size is not None
+            if response.status_code == 200:
+                length = response.headers.get("Content-Length")
+                return (int(length) if length else None), self._strong_validator(response), False
+            raise RuntimeError(f"Failed to probe {url}: HTTP {response.status_code}")
+
+    def download_parallel(self, url, output_path, headers=None, chunk_size=8 * 1024 * 1024, max_workers=8,
+                          min_parallel_size=16 * 1024 * 1024, progress=None):
+        """Download url as byte ranges fetched concurrently into a preallocated file.
+
+        Falls back to a single streamed download when the server doesn't support ranges or the file
+        is small. Finished ranges are recorded in a sidecar state file next to the part file, so an
+        interrupted download only fetches what is missing, provided size and validator are unchanged.
+        Ranges are requested with If-Range so a resource that changes mid-download is detected; servers
+        without a strong ETag or Last-Modified (weak ETags are ignored in If-Range) get a single stream.
+        """
+        size, validator, accepts_ranges = self.probe(url, headers)
+        reporter = ProgressReporter(progress, size)
+        if not accepts_ranges or not validator or size < min_parallel_size:
+            return self.download(url, output_path, headers=headers, progress=reporter)
+
+        part_path = f"{output_path}.part"
+        state_path = f"{part_path}.json"
+        ranges = [(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)]
+        done = set()
+        if os.path.exists(part_path) and os.path.exists(state_path):
+            state = self._read_state(state_path)
+            if state.get("mode") == "ranges" and state.get("url") == url and state.get("size") == size and state.get("validator") == validator:
+                done = set(state.get("done", []))
+        if not done:
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+        reporter.add(sum(ranges[i][1] - ranges[i][0] + 1 for i in done))
+        state_lock = threading.Lock()
+
+        def save_state():
+            tmp_path = f"{state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"mode": "ranges", "url": url, "size": size, "validator": validator, "done": sorted(done)}, f)
+            os.replace(tmp_path, state_path)
+
+        def fetch(index):
+            start, end = ranges[index]
+            range_headers = {**(headers or {}), "Range": f"bytes={start}-{end}"}
+            range_headers["If-Range"] = validator
+            written = 0
+            with self.get(url, headers=range_headers, stream=True) as response:
+                if response.status_code != 206:
+                    raise RuntimeError(f"Range request for {url} returned HTTP {response.status_code}; "
+                                       "the file may have changed on the server")
+                with open(part_path, "r+b") as f:
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            written += len(chunk)
+                            reporter.add(len(chunk))
+            if written != end - start + 1:
+                raise RuntimeError(f"Range {start}-{end} of {url} was truncated ({written} bytes)")
+            with state_lock:
+                done.add(index)
+                save_state()
+
+        pending = [i for i in range(len(ranges)) if i not in done]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in concurrent.futures.as_completed([executor.submit(fetch, i) for i in pending]):
+                future.result()
+
+        if os.path.getsize(part_path) != size:
+            raise RuntimeError(f"Downloaded size of {url} does not match the expected {size} bytes")
+        reporter.finish()
+        os.replace(part_path, output_path)
+        os.remove(state_path)
+        return output_path
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,40 @@
+import io
+import hashlib
+import numpy as np
+from PIL import Image
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+class EncodedImage:
+    """An image encoded once in memory, ready to hand to an uploader or inline in a request."""
+
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+
+    @property
+    def digest(self):
+        return hashlib.sha256(self.data).hexdigest()
+
+    def as_part(self):
+        """Inline blob in the form accepted by Gemini's generate_content."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def encode_image(image, format="JPEG", quality=90):
+    """Encode a numpy array or PIL image into an in-memory buffer without touching disk."""
+    if isinstance(image, EncodedImage):
+        return image
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    format = format.upper()
+    if format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if format == "PNG":
+        image.save(buffer, format=format)
+    else:
+        image.save(buffer, format=format, quality=quality)
+    return EncodedImage(buffer.getvalue(), MIME_TYPES.get(format, f"image/{format.lower()}"))
@@ -0,0 +1,176 @@
+import re
+import json
+
+_OPENERS = {'{': '}', '[': ']'}
+_OPEN = re.compile(r'[\[{]')
+# A whole string literal, a bracket, or a lone quote whose string hasn't been terminated yet
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}"]', re.DOTALL)
+_FENCE = "```"
+# What may follow an opening bracket (after whitespace) in real JSON
+_JSON_START = re.compile(r'\s*(?:["{\[\]}\-0-9]|(?:true|false|null)\b)')
+
+
+class JSONStreamExtractor:
+    """Single-pass, bracket-aware extractor for JSON objects and arrays embedded in LLM output.
+
+    Text can be fed in chunks as tokens stream in; every top-level object or array is parsed as soon
+    as its closing bracket arrives. A balanced top-level value that fails to parse is dropped as a
+    whole when it looks like JSON (the bracket is followed by a string, number, literal or bracket);
+    its members are never returned in its place. When an opening bracket turns out to be stray prose
+    (never closed, closed by the wrong bracket, or followed by plain words as in "[note: {...}]"),
+    the complete values nested after it are salvaged, using spans remembered while scanning so
+    nothing is rescanned.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.spans = []
+        self._buf = ""
+        self._offset = 0
+        self._pos = 0
+        # Open brackets: [expected closer, start index in _buf, completed child spans]
+        self._stack = []
+        self._final = False
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the values completed by it."""
+        buf = self._buf + chunk
+        pos = self._pos
+        stack = self._stack
+        found = []
+
+        while pos < len(buf):
+            if not stack:
+                # Outside any value only an opening bracket matters
+                match = _OPEN.search(buf, pos)
+                if not match:
+                    pos = len(buf)
+                    break
+                stack.append([_OPENERS[match.group()], match.start(), []])
+                pos = match.end()
+                continue
+
+            match = _TOKEN.search(buf, pos)
+            if not match:
+                pos = len(buf)
+                break
+            token = match.group()
+
+            if token == '"':
+                if not self._final:
+                    # The string may still be terminated by a later chunk
+                    pos = match.start()
+                    break
+                pos = match.end()
+                continue
+            pos = match.end()
+            if token[0] == '"':
+                continue
+
+            if token in _OPENERS:
+                stack.append([_OPENERS[token], match.start(), []])
+            elif token == stack[-1][0]:
+                closer, start, children = stack.pop()
+                if stack:
+                    stack[-1][2].append((start, pos, children))
+                else:
+                    found += self._finish(buf, start, pos, children)
+            else:
+                # Mismatched closer: none of the open candidates can be valid, keep their complete children
+                found += self._abandon(buf)
+
+        if not stack:
+            # Nothing before pos can start a value any more
+            self._offset += pos
+            buf = ""
+            pos = 0
+        self._buf = buf
+        self._pos = pos
+        return found
+
+    def close(self):
+        """Finish the stream, salvaging complete values from any unterminated candidate."""
+        self._final = True
+        found = self.feed("")
+        found += self._abandon(self._buf)
+        self._buf = ""
+        self._pos = 0
+        return found
+
+    def _finish(self, buf, start, end, children):
+        try:
+            value = json.loads(buf[start:end])
+        except json.JSONDecodeError:
+            # A malformed value is not replaced by one of its members, but a bracket around prose is
+            if _JSON_START.match(buf, start + 1):
+                return []
+            found = []
+            for child in children:
+                found += self._finish(buf, *child)
+            return found
+        self.values.append(value)
+        self.spans.append((self._offset + start, self._offset + end))
+        return [value]
+
+    def _abandon(self, buf):
+        found = []
+        for _, _, children in self._stack:
+            for child in children:
+                found += self._finish(buf, *child)
+        self._stack.clear()
+        return found
+
+
+def _fenced_span(text):
+    start = text.find(_FENCE)
+    if start == -1:
+        return None
+    end = text.find(_FENCE, start + len(_FENCE))
+    if end == -1:
+        return None
+    content_start = start + len(_FENCE)
+    # Skip a language tag such as ```json
+    newline = text.find("\n", content_start, end)
+    if newline != -1 and text[content_start:newline].strip().isalnum():
+        content_start = newline + 1
+    return content_start, end
+
+
+def extract_json(text):
+    """Parse JSON out of LLM output in one pass over the text.
+
+    Returns the whole output if it is valid JSON, else the value inside the first fenced code block,
+    else a single top-level array, else a list of every top-level value found. Returns None if
+    nothing parses.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    extractor = JSONStreamExtractor()
+    extractor.feed(text)
+    extractor.close()
+    if not extractor.values:
+        return None
+
+    fence = _fenced_span(text)
+    if fence:
+        content = text[fence[0]:fence[1]]
+        stripped_start = fence[0] + len(content) - len(content.lstrip())
+        stripped_end = fence[1] - len(content) + len(content.rstrip())
+        for value, span in zip(extractor.values, extractor.spans):
+            if span == (stripped_start, stripped_end):
+                return value
+
+    if len(extractor.values) == 1 and isinstance(extractor.values[0], list):
+        return extractor.values[0]
+    return extractor.values
+
+
+def iter_json(chunks):
+    """Yield JSON values from an iterable of text chunks as soon as each one is complete."""
+    extractor = JSONStreamExtractor()
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    yield from extractor.close()
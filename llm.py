@@ -5,23 +5,65 @@ dotenv_path = os.path.join(current_file_dir, '..', '..', '.env.development')
 load_dotenv(dotenv_path)
 
 import json
-import re
 import time
 import logging
 import markdown
 import datetime
 import asyncio
-from groq import Groq
+import atexit
+import threading
+import weakref
+from groq import Groq, AsyncGroq
 import hashlib
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 import openai
 from app import app
 import google.generativeai as genai
+from llm_cache import create_cache
+from retry_policy import RetryPolicy, retry_stats
+from single_flight import SingleFlight, FileLock
+from json_stream import extract_json
+from llm_stream import LLMStream, AsyncLLMStream, stream_metrics
+from semantic_cache import SemanticCache
+from llm_router import LLMRouter
 
 logger = logging.getLogger(__name__)
 
+class AsyncRateLimiter:
+    """Space out requests so no more than `rate` start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
 class LLM:
     CACHE_DIR = 'llm_cache'
+    LOCK_DIR = 'llm_locks'
+    # Keys share a fixed set of lock files; a collision only makes two different prompts wait on each other
+    LOCK_STRIPES = 256
+    _cache = None
+    _semantic_cache = None
+    _router = None
+    _single_flight = SingleFlight()
+    _clients = {}
+    _clients_pid = None
+    _clients_lock = threading.Lock()
+    _shutdown_hooks = []
+    _async_state = weakref.WeakKeyDictionary()
+
+    # Limits applied by call_async/call_many; override per call with opts["max_concurrency"] and opts["rate_limit"]
+    CONCURRENCY_LIMITS = {'claude': 8, 'openai': 16, 'blitzkong': 8, 'groq': 16, 'gemini': 8}
+    # Requests per second per service; services not listed are not rate limited
+    RATE_LIMITS = {}
 
     @classmethod
     def name_session(cls,chat):
@@ -40,21 +82,140 @@ class LLM:
         # Generate a hash of the cache data
         return hashlib.md5(cache_data.encode()).hexdigest()
 
+    @classmethod
+    def get_cache(cls):
+        # Backend is chosen with LLM_CACHE_BACKEND; see llm_cache.py for migrating the old llm_cache/ directory
+        if cls._cache is None:
+            cls._cache = create_cache()
+        return cls._cache
+
+    @classmethod
+    def set_cache(cls, cache):
+        cls._cache = cache
+
     @classmethod
     def _get_from_cache(cls, cache_key):
-        cache_file = os.path.join(cls.CACHE_DIR, f"{cache_key}.json")
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r') as f:
-                return json.load(f)
-        return None
+        return cls.get_cache().get(cache_key)
+
+    @classmethod
+    def _save_to_cache(cls, cache_key, data, ttl=None):
+        cls.get_cache().set(cache_key, data, ttl=ttl)
+
+    @classmethod
+    def get_semantic_cache(cls):
+        if cls._semantic_cache is None:
+            cls._semantic_cache = SemanticCache()
+        return cls._semantic_cache
+
+    @classmethod
+    def set_semantic_cache(cls, semantic_cache):
+        cls._semantic_cache = semantic_cache
+
+    @classmethod
+    def _semantic_lookup(cls, service, model, messages, opts):
+        """Return (namespace, key text, cached value) for opts["semantic_cache"] calls, else None.
+
+        opts["semantic_key"] should hold just the variable part of the prompt (e.g. the product
+        string) so that the shared template text doesn't dominate the similarity score.
+        """
+        if not opts.get("semantic_cache", False):
+            return None
+        namespace = f"{service}/{model}/{opts.get('semantic_namespace', 'default')}"
+        text = opts.get("semantic_key") or messages[-1]['content']
+        value = cls.get_semantic_cache().get(namespace, text, opts.get("semantic_threshold"))
+        if value is not None:
+            logger.info("Semantic cache hit. Returning cached response.")
+        return namespace, text, value
+
+    @classmethod
+    def _create_client(cls, service, model):
+        if service == 'claude':
+            return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        elif service == 'openai':
+            return openai.OpenAI(api_key=os.getenv("OPEN_API_KEY"))
+        elif service == 'blitzkong':
+            return openai.OpenAI(api_key='NONE', base_url=f"{os.getenv('BLITZKONG_HOST')}/v1")
+        elif service == 'groq':
+            return Groq(api_key=os.getenv("GROQ_KEY"))
+        elif service == 'gemini':
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            return genai.GenerativeModel(model)
+        raise ValueError(f"Unsupported service: {service}")
+
+    @classmethod
+    def get_client(cls, service, model=None):
+        """Return the pooled SDK client for a service, creating it once per process."""
+        # Gemini binds the model to the client object; the other SDKs take it per request
+        key = (service, model if service == 'gemini' else None)
+        with cls._clients_lock:
+            # Clients (and their connection pools) must not be shared across a fork
+            if cls._clients_pid != os.getpid():
+                cls._clients = {}
+                cls._clients_pid = os.getpid()
+            client = cls._clients.get(key)
+            if client is None:
+                client = cls._create_client(service, model)
+                cls._clients[key] = client
+            return client
+
+    @classmethod
+    def on_shutdown(cls, hook):
+        """Register a callable to run when the client registry is closed."""
+        cls._shutdown_hooks.append(hook)
+        return hook
+
+    @classmethod
+    def close_clients(cls):
+        with cls._clients_lock:
+            clients = list(cls._clients.values())
+            cls._clients = {}
+        for hook in cls._shutdown_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"Shutdown hook failed: {e}")
+        for client in clients:
+            close = getattr(client, 'close', None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.error(f"Failed to close client: {e}")
+
+    # Environment variable that must be set for a service to be a routing candidate
+    SERVICE_API_KEYS = {
+        'groq': "GROQ_KEY",
+        'openai': "OPEN_API_KEY",
+        'claude': "ANTHROPIC_API_KEY",
+        'gemini': "GEMINI_API_KEY",
+    }
+
+    @classmethod
+    def get_router(cls):
+        """Router used for opts["service"] == "auto"; candidates are the services with an API key set."""
+        if cls._router is None:
+            candidates = [
+                (service, cls.get_default_model(service))
+                for service, env_var in cls.SERVICE_API_KEYS.items() if os.getenv(env_var)
+            ]
+            if not candidates:
+                raise ValueError("No LLM service API keys configured for routing")
+            cls._router = LLMRouter(cls.call, cls.call_async, candidates)
+        return cls._router
+
+    @classmethod
+    def set_router(cls, router):
+        cls._router = router
+
+    @classmethod
+    def router_stats(cls):
+        """Rolling p50/p95 latency and error rate per routed service/model."""
+        return cls._router.snapshot() if cls._router else {}
 
     @classmethod
-    def _save_to_cache(cls, cache_key, data):
-        if not os.path.exists(cls.CACHE_DIR):
-            os.makedirs(cls.CACHE_DIR)
-        cache_file = os.path.join(cls.CACHE_DIR, f"{cache_key}.json")
-        with open(cache_file, 'w') as f:
-            json.dump(data, f)
+    def retry_stats(cls):
+        """Per-service attempt, retry, give-up and error-category counts."""
+        return retry_stats.snapshot()
 
     @classmethod
     def get_default_model(cls,service):
@@ -68,11 +229,7 @@ class LLM:
         return defaults.get(service, "unknown")
 
     @classmethod
-    def call(cls, prompt_or_messages, opts={}):
-        retry = opts.get("retry", 2)
-        service = opts.get("service", "groq")
-        use_cache = opts.get("use_cache", False)
-
+    def _to_messages(cls, prompt_or_messages):
         if isinstance(prompt_or_messages, str):
             messages = [{"role": "user", "content": prompt_or_messages}]
         elif isinstance(prompt_or_messages, list):
@@ -82,6 +239,73 @@ class LLM:
             raise ValueError("prompt_or_messages should be either a string or a list of messages")
 
         logger.info(f"Prompt: {messages[:50]}")
+        return messages
+
+    @classmethod
+    def _complete(cls, service, model, messages, opts):
+        client = cls.get_client(service, model)
+        if service == 'claude':
+            chat_completion = client.messages.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=4096,
+                    temperature=0
+                    )
+            return chat_completion.content[0].text
+        elif service == 'openai':
+            chat_completion = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    **({"response_format": {"type": "json_object"}} if opts.get("json",False) else {})
+                    )
+            return chat_completion.choices[0].message.content
+        elif service == 'blitzkong':
+            chat_completion = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0
+                    )
+            return chat_completion.choices[0].message.content
+        elif service == 'groq':
+            chat_completion = client.chat.completions.create(
+                    messages=messages, model=model, temperature=0)
+            return chat_completion.choices[0].message.content
+        elif service == 'gemini':
+            chat = client.start_chat(history=[])
+            return chat.send_message(messages[-1]['content']).text
+        raise ValueError(f"Unsupported service: {service}")
+
+    @classmethod
+    def _handle_response(cls, response, opts, cache_key, use_cache):
+        if opts.get("json", False):
+            json_response = cls.to_json(response)
+            if json_response is None:
+                raise ValueError("Failed to convert response to JSON")
+            else:
+                # Cache the JSON response
+                if use_cache:
+                    cls._save_to_cache(cache_key, json_response, opts.get("cache_ttl"))
+                if isinstance(json_response, list) and len(json_response) == 1:
+                    json_response = json_response[0] 
+                return json_response
+        else:
+            # Cache the text response
+            if use_cache:
+                cls._save_to_cache(cache_key, response, opts.get("cache_ttl"))
+            return response
+
+    @classmethod
+    def call(cls, prompt_or_messages, opts={}):
+        if opts.get("service") == "auto" and not opts.get("stream", False):
+            return cls.get_router().call(prompt_or_messages, opts)
+        if opts.get("stream", False):
+            return cls.stream(prompt_or_messages, opts)
+
+        service = opts.get("service", "groq")
+        use_cache = opts.get("use_cache", False)
+
+        messages = cls._to_messages(prompt_or_messages)
 
         # Generate a cache key based on the service, model, and prompt
         model = opts.get("model", cls.get_default_model(service))
@@ -94,80 +318,389 @@ class LLM:
                 logger.info("Cache hit. Returning cached response.")
                 return cached_response
 
-        for attempt in range(retry + 1):
+        semantic = cls._semantic_lookup(service, model, messages, opts)
+        if semantic and semantic[2] is not None:
+            return semantic[2]
+
+        if use_cache and opts.get("coalesce", True):
+            # Identical in-flight requests wait on a single provider call
+            response = cls._single_flight.do(
+                cache_key, lambda: cls._call_coalesced(service, model, messages, opts, cache_key)
+            )
+        else:
+            response = cls._call_provider(service, model, messages, opts, cache_key, use_cache)
+
+        if semantic:
+            cls.get_semantic_cache().set(semantic[0], semantic[1], response)
+        return response
+
+    @classmethod
+    def _lock_path(cls, cache_key):
+        stripe = int(hashlib.md5(cache_key.encode()).hexdigest(), 16) % cls.LOCK_STRIPES
+        return os.path.join(cls.LOCK_DIR, f"{stripe:03d}.lock")
+
+    @classmethod
+    def _call_coalesced(cls, service, model, messages, opts, cache_key):
+        if not opts.get("cross_process_lock", False):
+            return cls._call_provider(service, model, messages, opts, cache_key, True)
+        with FileLock(cls._lock_path(cache_key)):
+            # Another worker may have filled the cache while we waited for the lock
+            cached_response = cls._get_from_cache(cache_key)
+            if cached_response:
+                logger.info("Cache hit after waiting on another worker.")
+                return cached_response
+            return cls._call_provider(service, model, messages, opts, cache_key, True)
+
+    @classmethod
+    def _call_provider(cls, service, model, messages, opts, cache_key, use_cache):
+        policy = opts.get("retry_policy") or RetryPolicy(max_retries=opts.get("retry", 2))
+        for attempt in range(policy.max_retries + 1):
             try:
+                policy.stats.record_attempt(service)
                 start_time = time.time()
 
-                if service == 'claude':
-                    client = Anthropic(api_key=ANTHROPIC_API_KEY)
-                    chat_completion = client.messages.create(
-                            model=model,
-                            messages=messages,
-                            max_tokens=4096,
-                            temperature=0
-                            )
-                    response = chat_completion.content[0].text
-                elif service == 'openai':
-                    client = openai.OpenAI(api_key=os.getenv("OPEN_API_KEY"))
-                    chat_completion = client.chat.completions.create(
-                            model=model,
-                            messages=messages,
-                            temperature=0,
-                            **({"response_format": {"type": "json_object"}} if opts.get("json",False) else {})
-                            )
-                    response = chat_completion.choices[0].message.content
-                elif service == 'blitzkong':
-                    client = openai.OpenAI(api_key='NONE', base_url=f"{BLITZKONG_HOST}/v1")
-                    chat_completion = client.chat.completions.create(
-                            model=model,
-                            messages=messages,
-                            temperature=0
-                            )
-                    response = chat_completion.choices[0].message.content
-                elif service == 'groq':
-                    client = Groq(api_key=os.getenv("GROQ_KEY"))
-                    chat_completion = client.chat.completions.create(
-                            messages=messages, model=model, temperature=0)
-                    response = chat_completion.choices[0].message.content
-                elif service == 'gemini':
-                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-                    genaimodel = genai.GenerativeModel(model)
-                    chat = genaimodel.start_chat(history=[])
-                    response = chat.send_message(messages[-1]['content']).text
-                else:
-                    raise ValueError(f"Unsupported service: {service}")
+                response = cls._complete(service, model, messages, opts)
 
                 end_time = time.time()
                 runtime = end_time - start_time
                 logger.info(f"Runtime: {runtime:.2f} seconds")
 
-                if opts.get("json", False):
-                    json_response = cls.to_json(response)
-                    if json_response is None:
-                        raise ValueError("Failed to convert response to JSON")
-                    else:
-                        # Cache the JSON response
-                        if use_cache:
-                            cls._save_to_cache(cache_key, json_response)
-                        if isinstance(json_response, list) and len(json_response) == 1:
-                            json_response = json_response[0] 
-                        return json_response
-                else:
-                    # Cache the text response
-                    if use_cache:
-                        cls._save_to_cache(cache_key, response)
-                    return response
+                result = cls._handle_response(response, opts, cache_key, use_cache)
+                policy.stats.record_success(service)
+                return result
             except Exception as e:
                 logger.error(f"Attempt {attempt + 1} failed with error: {e}")
-                if attempt == retry:
+                delay = policy.on_error(service, e, attempt)
+                if delay is None:
                     raise e
-                else:
-                    logger.info(f"Retrying... ({attempt + 1}/{retry})")
+                logger.info(f"Retrying in {delay:.2f} seconds... ({attempt + 1}/{policy.max_retries})")
+                time.sleep(delay)
+
+    @classmethod
+    def _loop_state(cls):
+        # Async clients, semaphores and limiters are bound to the event loop that created them
+        loop = asyncio.get_running_loop()
+        state = cls._async_state.get(loop)
+        if state is None:
+            state = {"clients": {}, "semaphores": {}, "limiters": {}}
+            cls._async_state[loop] = state
+        return state
 
     @classmethod
-    async def call_async(cls, prompt, opts={}):
-        # Implement async version of the call method
-        return await asyncio.to_thread(cls.call, prompt, opts)
+    def _create_async_client(cls, service, model):
+        if service == 'claude':
+            return AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        elif service == 'openai':
+            return openai.AsyncOpenAI(api_key=os.getenv("OPEN_API_KEY"))
+        elif service == 'blitzkong':
+            return openai.AsyncOpenAI(api_key='NONE', base_url=f"{os.getenv('BLITZKONG_HOST')}/v1")
+        elif service == 'groq':
+            return AsyncGroq(api_key=os.getenv("GROQ_KEY"))
+        elif service == 'gemini':
+            # GenerativeModel exposes *_async methods on the same object
+            return cls.get_client(service, model)
+        raise ValueError(f"Unsupported service: {service}")
+
+    @classmethod
+    def get_async_client(cls, service, model=None):
+        clients = cls._loop_state()["clients"]
+        key = (service, model if service == 'gemini' else None)
+        if key not in clients:
+            clients[key] = cls._create_async_client(service, model)
+        return clients[key]
+
+    @classmethod
+    def _get_semaphore(cls, service, opts):
+        semaphores = cls._loop_state()["semaphores"]
+        if service not in semaphores:
+            limit = opts.get("max_concurrency", cls.CONCURRENCY_LIMITS.get(service, 8))
+            semaphores[service] = asyncio.Semaphore(limit)
+        return semaphores[service]
+
+    @classmethod
+    def _get_rate_limiter(cls, service, opts):
+        rate = opts.get("rate_limit", cls.RATE_LIMITS.get(service))
+        if not rate:
+            return None
+        limiters = cls._loop_state()["limiters"]
+        if service not in limiters:
+            limiters[service] = AsyncRateLimiter(rate)
+        return limiters[service]
+
+    @classmethod
+    async def _complete_async(cls, service, model, messages, opts):
+        client = cls.get_async_client(service, model)
+        if service == 'claude':
+            chat_completion = await client.messages.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=4096,
+                    temperature=0
+                    )
+            return chat_completion.content[0].text
+        elif service in ('openai', 'blitzkong', 'groq'):
+            extra = {"response_format": {"type": "json_object"}} if service == 'openai' and opts.get("json", False) else {}
+            chat_completion = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    **extra
+                    )
+            return chat_completion.choices[0].message.content
+        elif service == 'gemini':
+            chat = client.start_chat(history=[])
+            response = await chat.send_message_async(messages[-1]['content'])
+            return response.text
+        raise ValueError(f"Unsupported service: {service}")
+
+    @classmethod
+    async def call_async(cls, prompt_or_messages, opts={}):
+        if opts.get("service") == "auto" and not opts.get("stream", False):
+            return await cls.get_router().call_async(prompt_or_messages, opts)
+        if opts.get("stream", False):
+            return cls.stream_async(prompt_or_messages, opts)
+
+        service = opts.get("service", "groq")
+        use_cache = opts.get("use_cache", False)
+
+        messages = cls._to_messages(prompt_or_messages)
+        model = opts.get("model", cls.get_default_model(service))
+        cache_key = cls._generate_cache_key(service, model, messages)
+
+        if use_cache:
+            cached_response = cls._get_from_cache(cache_key)
+            if cached_response:
+                logger.info("Cache hit. Returning cached response.")
+                return cached_response
+
+        semantic = cls._semantic_lookup(service, model, messages, opts)
+        if semantic and semantic[2] is not None:
+            return semantic[2]
+
+        if use_cache and opts.get("coalesce", True):
+            response = await cls._single_flight.do_async(
+                cache_key, lambda: cls._call_coalesced_async(service, model, messages, opts, cache_key)
+            )
+        else:
+            response = await cls._call_provider_async(service, model, messages, opts, cache_key, use_cache)
+
+        if semantic:
+            cls.get_semantic_cache().set(semantic[0], semantic[1], response)
+        return response
+
+    @classmethod
+    async def _call_coalesced_async(cls, service, model, messages, opts, cache_key):
+        if not opts.get("cross_process_lock", False):
+            return await cls._call_provider_async(service, model, messages, opts, cache_key, True)
+        lock = FileLock(cls._lock_path(cache_key))
+        await asyncio.to_thread(lock.acquire)
+        try:
+            cached_response = cls._get_from_cache(cache_key)
+            if cached_response:
+                logger.info("Cache hit after waiting on another worker.")
+                return cached_response
+            return await cls._call_provider_async(service, model, messages, opts, cache_key, True)
+        finally:
+            lock.release()
+
+    @classmethod
+    async def _call_provider_async(cls, service, model, messages, opts, cache_key, use_cache):
+        semaphore = cls._get_semaphore(service, opts)
+        limiter = cls._get_rate_limiter(service, opts)
+
+        policy = opts.get("retry_policy") or RetryPolicy(max_retries=opts.get("retry", 2))
+        for attempt in range(policy.max_retries + 1):
+            try:
+                policy.stats.record_attempt(service)
+                async with semaphore:
+                    if limiter:
+                        await limiter.acquire()
+                    start_time = time.time()
+                    response = await cls._complete_async(service, model, messages, opts)
+                    logger.info(f"Runtime: {time.time() - start_time:.2f} seconds")
+
+                result = cls._handle_response(response, opts, cache_key, use_cache)
+                policy.stats.record_success(service)
+                return result
+            except Exception as e:
+                logger.error(f"Attempt {attempt + 1} failed with error: {e}")
+                delay = policy.on_error(service, e, attempt)
+                if delay is None:
+                    raise e
+                logger.info(f"Retrying in {delay:.2f} seconds... ({attempt + 1}/{policy.max_retries})")
+                # Back off outside the semaphore so other requests can use the slot
+                await asyncio.sleep(delay)
+
+    @classmethod
+    async def call_many(cls, prompts, opts={}, return_exceptions=False):
+        """Run many prompts concurrently, bounded by the per-service limits, and return results in input order."""
+        return await asyncio.gather(
+            *(cls.call_async(prompt, opts) for prompt in prompts),
+            return_exceptions=return_exceptions
+        )
+
+    @classmethod
+    def call_many_sync(cls, prompts, opts={}, return_exceptions=False):
+        """Blocking wrapper around call_many for code that isn't running an event loop; async callers await call_many."""
+        cls._require_no_running_loop("call_many_sync", "call_many")
+        return asyncio.run(cls.call_many(prompts, opts, return_exceptions))
+
+    @staticmethod
+    def _require_no_running_loop(name, async_name):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        raise RuntimeError(f"LLM.{name} can't be used inside a running event loop; await LLM.{async_name} instead")
+
+    @classmethod
+    def _stream_chunks(cls, service, model, messages, opts, usage):
+        client = cls.get_client(service, model)
+        if service == 'claude':
+            with client.messages.stream(
+                    model=model,
+                    messages=messages,
+                    max_tokens=4096,
+                    temperature=0
+                    ) as stream:
+                yield from stream.text_stream
+                usage["output_tokens"] = stream.get_final_message().usage.output_tokens
+        elif service in ('openai', 'blitzkong', 'groq'):
+            extra = {}
+            if service == 'openai':
+                extra["stream_options"] = {"include_usage": True}
+                if opts.get("json", False):
+                    extra["response_format"] = {"type": "json_object"}
+            response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    stream=True,
+                    **extra
+                    )
+            for chunk in response:
+                cls._record_stream_usage(chunk, usage)
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content
+        elif service == 'gemini':
+            chat = client.start_chat(history=[])
+            response = chat.send_message(messages[-1]['content'], stream=True)
+            for chunk in response:
+                yield chunk.text
+            cls._record_stream_usage(response, usage)
+        else:
+            raise ValueError(f"Unsupported service: {service}")
+
+    @classmethod
+    async def _stream_chunks_async(cls, service, model, messages, opts, usage):
+        client = cls.get_async_client(service, model)
+        limiter = cls._get_rate_limiter(service, opts)
+        async with cls._get_semaphore(service, opts):
+            if limiter:
+                await limiter.acquire()
+            if service == 'claude':
+                async with client.messages.stream(
+                        model=model,
+                        messages=messages,
+                        max_tokens=4096,
+                        temperature=0
+                        ) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    final_message = await stream.get_final_message()
+                    usage["output_tokens"] = final_message.usage.output_tokens
+            elif service in ('openai', 'blitzkong', 'groq'):
+                extra = {}
+                if service == 'openai':
+                    extra["stream_options"] = {"include_usage": True}
+                    if opts.get("json", False):
+                        extra["response_format"] = {"type": "json_object"}
+                response = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0,
+                        stream=True,
+                        **extra
+                        )
+                async for chunk in response:
+                    cls._record_stream_usage(chunk, usage)
+                    if chunk.choices:
+                        yield chunk.choices[0].delta.content
+            elif service == 'gemini':
+                chat = client.start_chat(history=[])
+                response = await chat.send_message_async(messages[-1]['content'], stream=True)
+                async for chunk in response:
+                    yield chunk.text
+                cls._record_stream_usage(response, usage)
+            else:
+                raise ValueError(f"Unsupported service: {service}")
+
+    @staticmethod
+    def _record_stream_usage(chunk, usage):
+        # OpenAI sends usage on the final chunk, Groq under x_groq, Gemini as usage_metadata
+        openai_usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        if openai_usage and getattr(openai_usage, 'completion_tokens', None):
+            usage["output_tokens"] = openai_usage.completion_tokens
+        usage_metadata = getattr(chunk, 'usage_metadata', None)
+        if usage_metadata and getattr(usage_metadata, 'candidates_token_count', None):
+            usage["output_tokens"] = usage_metadata.candidates_token_count
+
+    @classmethod
+    def _prepare_stream(cls, prompt_or_messages, opts):
+        if opts.get("service") == "auto":
+            # Streams can't be hedged, but they still go to the fastest healthy provider
+            service, model = cls.get_router().ranked()[0]
+            opts = {**opts, "service": service, "model": model}
+        service = opts.get("service", "groq")
+        use_cache = opts.get("use_cache", False)
+        messages = cls._to_messages(prompt_or_messages)
+        model = opts.get("model", cls.get_default_model(service))
+        cache_key = cls._generate_cache_key(service, model, messages)
+        policy = opts.get("retry_policy") or RetryPolicy(max_retries=opts.get("retry", 2))
+
+        cached_response = cls._get_from_cache(cache_key) if use_cache else None
+        if cached_response and not isinstance(cached_response, str):
+            cached_response = json.dumps(cached_response)
+
+        def on_complete(text):
+            # Same parsing and caching as a non-streamed call, so cache entries stay interchangeable
+            cls._handle_response(text, opts, cache_key, use_cache)
+
+        return service, model, messages, policy, cached_response, on_complete
+
+    @classmethod
+    def stream(cls, prompt_or_messages, opts={}):
+        """Stream the completion as text chunks.
+
+        Returns an LLMStream; iterate it for chunks, then read .text and .metrics
+        (time-to-first-token and tokens/sec). Per-service aggregates are in LLM.stream_metrics().
+        """
+        service, model, messages, policy, cached_response, on_complete = cls._prepare_stream(prompt_or_messages, opts)
+        if cached_response:
+            logger.info("Cache hit. Streaming cached response.")
+            return LLMStream(lambda usage: iter([cached_response]), service, model, policy)
+        return LLMStream(
+            lambda usage: cls._stream_chunks(service, model, messages, opts, usage),
+            service, model, policy, on_complete
+        )
+
+    @classmethod
+    def stream_async(cls, prompt_or_messages, opts={}):
+        """Async iterator version of stream."""
+        service, model, messages, policy, cached_response, on_complete = cls._prepare_stream(prompt_or_messages, opts)
+        if cached_response:
+            async def cached_chunks(usage):
+                yield cached_response
+            return AsyncLLMStream(cached_chunks, service, model, policy)
+        return AsyncLLMStream(
+            lambda usage: cls._stream_chunks_async(service, model, messages, opts, usage),
+            service, model, policy, on_complete
+        )
+
+    @classmethod
+    def stream_metrics(cls):
+        """Average time-to-first-token and tokens/sec per service/model for streamed calls."""
+        return stream_metrics.snapshot()
 
     @classmethod
     def template(cls,template_name,opts={}):
@@ -178,7 +711,7 @@ class LLM:
         return cls.call(template_content, opts)
 
     @classmethod
-    def to_domain(cls,string):
+    def to_domain(cls,string,opts={}):
         # select name,importance,searchVolume,directUrl,url from merchants order by importance, searchVolume desc limit 1000
         prompt = f'''return the best matching root domain to answer the question given the query, dont include www.
 only return the url such as:
@@ -188,21 +721,195 @@ nike.com
 query:
 {string}'''
 
-        output = LLM.call(prompt)
+        output = LLM.call(prompt, {"semantic_namespace": "to_domain", "semantic_key": string, **opts})
         return output
 
     @classmethod
-    def to_category(cls,string):
+    def to_category(cls,string,opts={}):
         # TODO isaac give us a list of all categories
-        output = LLM.call(f"extract the general product category (ie shoes or pants) for the given string, only return the category. Always return a category that is the closest match.:\n\n {string}")
+        output = LLM.call(f"extract the general product category (ie shoes or pants) for the given string, only return the category. Always return a category that is the closest match.:\n\n {string}",
+                          {"semantic_namespace": "to_category", "semantic_key": string, **opts})
         return output
 
     @classmethod
-    def to_product(cls,string):
-        output = LLM.call(f"extract the product from the given string, only return the product name:\n\n {string}")
+    def to_product(cls,string,opts={}):
+        output = LLM.call(f"extract the product from the given string, only return the product name:\n\n {string}",
+                          {"semantic_namespace": "to_product", "semantic_key": string, **opts})
         print(f"PRODUCT:{output}")
         return output
 
+    # Batch instructions mirror the single-item prompts above
+    BATCH_INSTRUCTIONS = {
+        'to_domain': "For each query, return the best matching root domain (such as amazon.com or nike.com), dont include www.",
+        'to_category': "For each string, extract the general product category (ie shoes or pants). Always return a category that is the closest match.",
+        'to_product': "For each string, extract the product name.",
+    }
+    CONTEXT_WINDOWS = {
+        'llama-3.1-70b-versatile': 131072,
+        'llama3-8b-8192': 8192,
+        'gpt-4-0125-preview': 128000,
+        'claude-3-opus-20240229': 200000,
+        'mistral-7b-instruct-v0.1': 8192,
+        'gemini-1.5-flash': 1048576,
+    }
+    MAX_OUTPUT_TOKENS = {'claude': 4096, 'openai': 4096, 'blitzkong': 2048, 'groq': 8000, 'gemini': 8192}
+    MAX_BATCH_SIZE = 100
+
+    @staticmethod
+    def _estimate_tokens(text):
+        return len(text) // 4 + 1
+
+    @classmethod
+    def _plan_batches(cls, items, service, model, per_item_output_tokens=24):
+        """Pack items into batches that fit both the model's context window and its output limit."""
+        context = cls.CONTEXT_WINDOWS.get(model, 8192)
+        output_budget = cls.MAX_OUTPUT_TOKENS.get(service, 4096)
+        input_budget = context - output_budget - 500
+        batches, current, input_tokens = [], [], 0
+        for item in items:
+            item_tokens = cls._estimate_tokens(item[1]) + 8
+            full = (
+                len(current) >= cls.MAX_BATCH_SIZE
+                or (len(current) + 1) * per_item_output_tokens > output_budget
+                or input_tokens + item_tokens > input_budget
+            )
+            if current and full:
+                batches.append(current)
+                current, input_tokens = [], 0
+            current.append(item)
+            input_tokens += item_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @classmethod
+    def _batch_prompt(cls, method, batch):
+        lines = "\n".join(f"{i}: {json.dumps(string)}" for i, string in batch)
+        return f"""{cls.BATCH_INSTRUCTIONS[method]}
+Return only a JSON object of the form {{"results": {{"<id>": "<answer>"}}}} with one entry for every id below.
+
+{lines}"""
+
+    @staticmethod
+    def _parse_batch_results(parsed):
+        if isinstance(parsed, list):
+            merged = {}
+            for part in parsed:
+                if isinstance(part, dict):
+                    merged.update(part)
+            parsed = merged
+        if not isinstance(parsed, dict):
+            return {}
+        results = parsed.get("results", parsed)
+        if isinstance(results, list):
+            return {str(r.get("id")): r.get("value") or r.get("answer") for r in results if isinstance(r, dict)}
+        return {str(k): v for k, v in results.items()} if isinstance(results, dict) else {}
+
+    @classmethod
+    async def _resolve_batch_async(cls, method, batch, opts, parsed, results):
+        """Fill results from a parsed batch response and bisect whatever is still missing."""
+        answers = cls._parse_batch_results(parsed) if parsed is not None else {}
+        missing = []
+        for i, string in batch:
+            answer = answers.get(str(i))
+            if isinstance(answer, str) and answer.strip():
+                results[i] = answer.strip()
+            else:
+                missing.append((i, string))
+        if not missing:
+            return
+        if len(missing) == 1:
+            # A single item that still fails falls back to the one-item prompt
+            i, string = missing[0]
+            try:
+                results[i] = await asyncio.to_thread(getattr(cls, method), string, opts)
+            except Exception as e:
+                logger.error(f"{method} failed for item {i}: {e}")
+            return
+        middle = len(missing) // 2
+
+        async def resolve_half(half):
+            try:
+                parsed_half = await cls.call_async(cls._batch_prompt(method, half), {**opts, "json": True})
+            except Exception as e:
+                logger.error(f"{method} batch of {len(half)} failed: {e}")
+                parsed_half = None
+            await cls._resolve_batch_async(method, half, opts, parsed_half, results)
+
+        await asyncio.gather(resolve_half(missing[:middle]), resolve_half(missing[middle:]))
+
+    @classmethod
+    async def _batch_extract_async(cls, method, strings, opts={}):
+        service = opts.get("service", "groq")
+        model = opts.get("model", cls.get_default_model(service))
+        results = [None] * len(strings)
+
+        pending = list(enumerate(strings))
+        if opts.get("semantic_cache", False):
+            namespace = f"{service}/{model}/{method}"
+            semantic_cache = cls.get_semantic_cache()
+            still_pending = []
+            for i, string in pending:
+                cached = semantic_cache.get(namespace, string, opts.get("semantic_threshold"))
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    still_pending.append((i, string))
+            pending = still_pending
+
+        batches = cls._plan_batches(pending, service, model)
+        logger.info(f"{method}: {len(pending)} items in {len(batches)} batches")
+        item_opts = {**opts, "semantic_cache": False}
+        responses = await cls.call_many(
+            [cls._batch_prompt(method, batch) for batch in batches], {**item_opts, "json": True}, return_exceptions=True
+        )
+        resolves = []
+        for batch, response in zip(batches, responses):
+            if isinstance(response, Exception):
+                logger.error(f"{method} batch of {len(batch)} failed: {response}")
+                response = None
+            resolves.append(cls._resolve_batch_async(method, batch, item_opts, response, results))
+        await asyncio.gather(*resolves)
+
+        if opts.get("semantic_cache", False):
+            answered = [(string, results[i]) for i, string in pending if results[i] is not None]
+            if answered:
+                cls.get_semantic_cache().set_many(namespace, [a[0] for a in answered], [a[1] for a in answered])
+        return results
+
+    @classmethod
+    def _batch_extract(cls, method, strings, opts={}):
+        """Blocking entry point for non-async callers; inside an event loop use the *_batch_async methods."""
+        cls._require_no_running_loop(f"{method}_batch", f"{method}_batch_async")
+        return asyncio.run(cls._batch_extract_async(method, strings, opts))
+
+    @classmethod
+    def to_domain_batch(cls, strings, opts={}):
+        """Batched to_domain: many queries per request, results in input order (None where it failed)."""
+        return cls._batch_extract('to_domain', strings, opts)
+
+    @classmethod
+    def to_category_batch(cls, strings, opts={}):
+        """Batched to_category: many strings per request, results in input order (None where it failed)."""
+        return cls._batch_extract('to_category', strings, opts)
+
+    @classmethod
+    def to_product_batch(cls, strings, opts={}):
+        """Batched to_product: many strings per request, results in input order (None where it failed)."""
+        return cls._batch_extract('to_product', strings, opts)
+
+    @classmethod
+    async def to_domain_batch_async(cls, strings, opts={}):
+        return await cls._batch_extract_async('to_domain', strings, opts)
+
+    @classmethod
+    async def to_category_batch_async(cls, strings, opts={}):
+        return await cls._batch_extract_async('to_category', strings, opts)
+
+    @classmethod
+    async def to_product_batch_async(cls, strings, opts={}):
+        return await cls._batch_extract_async('to_product', strings, opts)
+
     @classmethod
     def to_json(cls,output,can_raise=False):
         def log_unparsed_json(data):
@@ -212,41 +919,9 @@ query:
             filename = f"bad_json/{timestamp}.txt"
             with open(filename, 'w') as file:
                 file.write(data)
-        try:
-            json_data = json.loads(output)
+        json_data = extract_json(output)
+        if json_data is not None:
             return json_data
-        except json.JSONDecodeError:
-            pass
-        regex = r"```(.*?)```"
-        matches = re.findall(regex, output, re.DOTALL)
-        if matches:
-            try:
-                json_data = json.loads(matches[0])
-                return json_data
-            except json.JSONDecodeError:
-                pass
-
-        json_objects = []
-        json_pattern = r"\{.*?\}"
-        for match in re.findall(json_pattern, output, re.DOTALL):
-            try:
-                json_data = json.loads(match)
-                json_objects.append(json_data)
-            except json.JSONDecodeError:
-                # Skip invalid JSON objects
-                pass
-        if json_objects:
-            return json_objects
-
-        json_regex = re.compile(r'\{.*\}|\[.*\]', re.DOTALL)
-        match = json_regex.search(output)
-
-        if match:
-            json_str = match.group()
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                pass
 
         #TODO finally try with llm and return something
         print(f"problem with JSON\n{output}")
@@ -263,3 +938,5 @@ query:
             prompt = f"Take the following text and convert it to HTML for people to click on links, return only the HTML and nothing else:\n\n{string}"
             print(f"TO_HTML\n{prompt}")
             return LLM.call(prompt)
+
+atexit.register(LLM.close_clients)
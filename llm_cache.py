@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+
+class JSONDirCache:
+    """Legacy backend: one JSON file per cache key in a directory."""
+
+    def __init__(self, cache_dir='llm_cache'):
+        self.cache_dir = cache_dir
+
+    def get(self, cache_key):
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        return None
+
+    def set(self, cache_key, data, ttl=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        with open(cache_file, 'w') as f:
+            json.dump(data, f)
+
+    def items(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                with open(path, 'r') as f:
+                    yield file_name[:-len('.json')], json.load(f), os.path.getmtime(path)
+            except (OSError, json.JSONDecodeError):
+                continue
+
+
+class SQLiteCache:
+    """Single-file SQLite cache with a key index, per-entry TTL and LRU eviction.
+
+    The database runs in WAL mode so several worker processes can read concurrently while one writes.
+    Each thread gets its own connection. Reads only write back the LRU access time when the stored one
+    is older than touch_interval seconds, so hot keys don't turn every read into a write transaction.
+    """
+
+    def __init__(self, path='llm_cache.sqlite', max_entries=100000, default_ttl=None, touch_interval=300):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                expires REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires)')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, cache_key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value, accessed FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (cache_key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.touch_interval:
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, cache_key))
+            conn.commit()
+        return json.loads(row[0])
+
+    def set(self, cache_key, data, ttl=None, created=None):
+        conn = self._conn()
+        now = time.time()
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires = now + ttl if ttl else None
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, created, accessed, expires) VALUES (?, ?, ?, ?, ?)',
+            (cache_key, json.dumps(data), created or now, created or now, expires)
+        )
+        conn.commit()
+        self._writes += 1
+        # Amortise eviction instead of counting rows on every write
+        if self._writes % 100 == 0:
+            self.evict()
+
+    def get_meta(self, key):
+        row = self._conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+        conn.commit()
+
+    def delete(self, cache_key):
+        conn = self._conn()
+        conn.execute('DELETE FROM cache WHERE key = ?', (cache_key,))
+        conn.commit()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones beyond max_entries."""
+        conn = self._conn()
+        removed = conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),)).rowcount
+        if self.max_entries:
+            count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self.max_entries:
+                removed += conn.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)',
+                    (count - self.max_entries,)
+                ).rowcount
+        conn.commit()
+        return removed
+
+    def stats(self):
+        conn = self._conn()
+        count, expired = conn.execute(
+            'SELECT COUNT(*), SUM(CASE WHEN expires IS NOT NULL AND expires <= ? THEN 1 ELSE 0 END) FROM cache',
+            (time.time(),)
+        ).fetchone()
+        return {'entries': count, 'expired': expired or 0, 'size_bytes': os.path.getsize(self.path)}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def migrate_json_dir(cache_dir, sqlite_cache):
+    """Copy every entry of a legacy llm_cache/ directory into a SQLiteCache, keeping file mtimes as timestamps."""
+    migrated = 0
+    conn = sqlite_cache._conn()
+    for cache_key, data, mtime in JSONDirCache(cache_dir).items():
+        conn.execute(
+            'INSERT OR IGNORE INTO cache (key, value, created, accessed, expires) VALUES (?, ?, ?, ?, NULL)',
+            (cache_key, json.dumps(data), mtime, mtime)
+        )
+        migrated += 1
+        if migrated % 1000 == 0:
+            conn.commit()
+            print(f"Migrated {migrated} entries...")
+    conn.commit()
+    return migrated
+
+
+def create_cache(backend=None):
+    """Build the cache backend selected by LLM_CACHE_BACKEND ("sqlite" or "json").
+
+    The first time a SQLite cache is opened next to an existing legacy llm_cache/ directory, the
+    directory's entries are imported so existing deployments keep their warm cache.
+    """
+    backend = backend or os.getenv('LLM_CACHE_BACKEND', 'sqlite')
+    cache_dir = os.getenv('LLM_CACHE_DIR', 'llm_cache')
+    if backend == 'json':
+        return JSONDirCache(cache_dir)
+    if backend == 'sqlite':
+        ttl = os.getenv('LLM_CACHE_TTL')
+        cache = SQLiteCache(
+            path=os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite'),
+            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', 100000)),
+            default_ttl=float(ttl) if ttl else None
+        )
+        source = os.path.abspath(cache_dir)
+        if os.path.isdir(cache_dir) and cache.get_meta('migrated_from') != source:
+            # INSERT OR IGNORE makes a concurrent migration by another process harmless
+            count = migrate_json_dir(cache_dir, cache)
+            cache.set_meta('migrated_from', source)
+            print(f"Imported {count} entries from {cache_dir} into {cache.path}")
+        return cache
+    raise ValueError(f"Unsupported cache backend: {backend}")
+
+# Migrate a legacy cache directory:
+# python llm_cache.py llm_cache llm_cache.sqlite
+if __name__ == "__main__":
+    source_dir = sys.argv[1] if len(sys.argv) > 1 else 'llm_cache'
+    target_path = sys.argv[2] if len(sys.argv) > 2 else 'llm_cache.sqlite'
+    cache = SQLiteCache(target_path, max_entries=None)
+    count = migrate_json_dir(source_dir, cache)
+    print(f"Migrated {count} entries from {source_dir} to {target_path}")
+    print(cache.stats())
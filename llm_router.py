@@ -0,0 +1,184 @@
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """Rolling latency and error statistics for one service/model."""
+
+    def __init__(self, window=100):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.samples.append((latency, ok))
+
+    def _latencies(self):
+        return sorted(latency for latency, ok in self.samples if ok)
+
+    def percentile(self, pct):
+        with self._lock:
+            latencies = self._latencies()
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct))]
+
+    def error_rate(self):
+        with self._lock:
+            if not self.samples:
+                return 0.0
+            return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def snapshot(self):
+        with self._lock:
+            count = len(self.samples)
+        return {"samples": count, "p50": self.percentile(0.5), "p95": self.percentile(0.95), "error_rate": self.error_rate()}
+
+
+class LLMRouter:
+    """Send each request to the fastest healthy provider and optionally hedge slow ones.
+
+    Candidates are (service, model) pairs. Providers whose recent error rate exceeds max_error_rate
+    are skipped while a healthy one exists; the rest are ordered by median latency, with providers
+    that have no samples yet tried first. With hedging on, if the primary hasn't answered within its
+    own p95 latency a second request goes to the next provider and the first answer wins.
+    """
+
+    def __init__(self, call_fn, call_async_fn, candidates, hedge=True, max_error_rate=0.5, min_hedge_delay=1.0,
+                 default_hedge_delay=10.0, window=100):
+        self.call_fn = call_fn
+        self.call_async_fn = call_async_fn
+        self.candidates = list(candidates)
+        self.hedge = hedge
+        self.max_error_rate = max_error_rate
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.stats = {candidate: ProviderStats(window) for candidate in self.candidates}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-router")
+
+    def ranked(self):
+        healthy = [c for c in self.candidates if self.stats[c].error_rate() <= self.max_error_rate]
+        pool = healthy or self.candidates
+
+        def score(candidate):
+            p50 = self.stats[candidate].percentile(0.5)
+            return (p50 is not None, p50 or 0.0)
+
+        return sorted(pool, key=score)
+
+    def hedge_delay(self, candidate):
+        p95 = self.stats[candidate].percentile(0.95)
+        return max(self.min_hedge_delay, p95) if p95 is not None else self.default_hedge_delay
+
+    def _opts_for(self, candidate, opts):
+        service, model = candidate
+        # Fail over quickly instead of retrying one provider; callers can still set opts["retry"]
+        return {**opts, "service": service, "model": model, "retry": opts.get("retry", 0)}
+
+    def _timed_call(self, candidate, prompt, opts):
+        start = time.time()
+        try:
+            result = self.call_fn(prompt, self._opts_for(candidate, opts))
+        except Exception:
+            self.stats[candidate].record(time.time() - start, False)
+            raise
+        self.stats[candidate].record(time.time() - start, True)
+        return result
+
+    async def _timed_call_async(self, candidate, prompt, opts):
+        start = time.time()
+        try:
+            result = await self.call_async_fn(prompt, self._opts_for(candidate, opts))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats[candidate].record(time.time() - start, False)
+            raise
+        self.stats[candidate].record(time.time() - start, True)
+        return result
+
+    def call(self, prompt, opts={}):
+        order = self.ranked()
+        hedge = opts.get("hedge", self.hedge)
+        last_error = None
+        pending = {}
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            candidate = order[next_index]
+            next_index += 1
+            pending[self._executor.submit(self._timed_call, candidate, prompt, opts)] = candidate
+            return candidate
+
+        launch()
+        while pending:
+            timeout = None
+            if hedge and next_index < len(order) and len(pending) == 1:
+                timeout = self.hedge_delay(next(iter(pending.values())))
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                candidate = launch()
+                logger.info(f"Hedging request to {candidate[0]}/{candidate[1]}")
+                continue
+            for future in done:
+                candidate = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"{candidate[0]}/{candidate[1]} failed: {e}")
+                    last_error = e
+                    continue
+                # The losing request is left to finish in the background; its latency still feeds the stats
+                return result
+            if not pending and next_index < len(order):
+                launch()
+        raise last_error
+
+    async def call_async(self, prompt, opts={}):
+        order = self.ranked()
+        hedge = opts.get("hedge", self.hedge)
+        last_error = None
+        pending = {}
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            candidate = order[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self._timed_call_async(candidate, prompt, opts))] = candidate
+            return candidate
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge and next_index < len(order) and len(pending) == 1:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    candidate = launch()
+                    logger.info(f"Hedging request to {candidate[0]}/{candidate[1]}")
+                    continue
+                for task in done:
+                    candidate = pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.error(f"{candidate[0]}/{candidate[1]} failed: {e}")
+                        last_error = e
+                if not pending and next_index < len(order):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    def snapshot(self):
+        return {f"{service}/{model}": stats.snapshot() for (service, model), stats in self.stats.items()}
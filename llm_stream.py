@@ -0,0 +1,137 @@
+import time
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class StreamMetrics:
+    """Aggregated time-to-first-token and tokens/sec per service and model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, service, model, ttft, duration, tokens):
+        with self._lock:
+            stats = self._stats.setdefault(f"{service}/{model}", {"calls": 0, "ttft_total": 0.0, "duration_total": 0.0, "tokens_total": 0})
+            stats["calls"] += 1
+            stats["ttft_total"] += ttft or 0.0
+            stats["duration_total"] += duration
+            stats["tokens_total"] += tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: {
+                    "calls": s["calls"],
+                    "avg_ttft": s["ttft_total"] / s["calls"],
+                    "avg_tokens_per_sec": s["tokens_total"] / s["duration_total"] if s["duration_total"] else 0.0,
+                }
+                for key, s in self._stats.items()
+            }
+
+
+stream_metrics = StreamMetrics()
+
+
+class _StreamBase:
+    def __init__(self, service, model, on_complete=None):
+        self.service = service
+        self.model = model
+        self.on_complete = on_complete
+        # Provider chunk generators write the reported output token count here when available
+        self.usage = {}
+        self.chunks = []
+        self.ttft = None
+        self.duration = None
+        self.tokens_per_sec = None
+        self._start = None
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def _begin(self):
+        self.chunks = []
+        self.usage = {}
+        self.ttft = None
+        self._start = time.time()
+
+    def _on_chunk(self, chunk):
+        if self.ttft is None:
+            self.ttft = time.time() - self._start
+        self.chunks.append(chunk)
+
+    def _finish(self):
+        self.duration = time.time() - self._start
+        tokens = self.usage.get("output_tokens") or len(self.chunks)
+        generation_time = self.duration - (self.ttft or 0.0)
+        self.tokens_per_sec = tokens / generation_time if generation_time > 0 else 0.0
+        logger.info(f"Stream {self.service}/{self.model}: ttft {self.ttft or 0.0:.2f}s, "
+                    f"{tokens} tokens in {self.duration:.2f}s ({self.tokens_per_sec:.1f} tokens/sec)")
+        stream_metrics.record(self.service, self.model, self.ttft, self.duration, tokens)
+        if self.on_complete:
+            self.on_complete(self.text)
+
+    @property
+    def metrics(self):
+        return {"ttft": self.ttft, "duration": self.duration, "tokens_per_sec": self.tokens_per_sec}
+
+
+class LLMStream(_StreamBase):
+    """Iterate over text chunks from a provider, retrying only if it fails before the first chunk."""
+
+    def __init__(self, start_stream, service, model, policy, on_complete=None):
+        super().__init__(service, model, on_complete)
+        self.start_stream = start_stream
+        self.policy = policy
+
+    def __iter__(self):
+        for attempt in range(self.policy.max_retries + 1):
+            self._begin()
+            try:
+                self.policy.stats.record_attempt(self.service)
+                for chunk in self.start_stream(self.usage):
+                    if chunk:
+                        self._on_chunk(chunk)
+                        yield chunk
+                break
+            except Exception as e:
+                logger.error(f"Stream attempt {attempt + 1} failed with error: {e}")
+                # Chunks already reached the caller, so the stream can't be restarted transparently
+                delay = self.policy.on_error(self.service, e, attempt) if not self.chunks else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        self.policy.stats.record_success(self.service)
+        self._finish()
+
+
+class AsyncLLMStream(_StreamBase):
+    """Async iterator counterpart of LLMStream."""
+
+    def __init__(self, start_stream, service, model, policy, on_complete=None):
+        super().__init__(service, model, on_complete)
+        self.start_stream = start_stream
+        self.policy = policy
+
+    async def __aiter__(self):
+        for attempt in range(self.policy.max_retries + 1):
+            self._begin()
+            try:
+                self.policy.stats.record_attempt(self.service)
+                async for chunk in self.start_stream(self.usage):
+                    if chunk:
+                        self._on_chunk(chunk)
+                        yield chunk
+                break
+            except Exception as e:
+                logger.error(f"Stream attempt {attempt + 1} failed with error: {e}")
+                delay = self.policy.on_error(self.service, e, attempt) if not self.chunks else None
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+        self.policy.stats.record_success(self.service)
+        self._finish()
@@ -1,17 +1,28 @@
 import os
-import requests
 import time
 from lumaai import LumaAI
 from dotenv import load_dotenv
+from result_cache import ResultCache
+from http_transport import HTTPTransport, print_progress
 
 class LumaVideoGenerator:
-    def __init__(self):
+    def __init__(self, cache=None, http=None):
         load_dotenv()
         self.client = LumaAI(
             auth_token=os.environ.get("LUMA_API_TOKEN"),
         )
+        self.cache = cache or ResultCache.default()
+        self.http = http or HTTPTransport.default()
+
+    def generate_video(self, prompt, image_url, output_path, use_cache=True):
+        cache_key = self.cache.make_key("luma", "dream-machine", {"prompt": prompt, "loop": True, "image_url": image_url})
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached:
+                print(f"Cache hit. Restoring video to {output_path}")
+                self.cache.restore(cached, [output_path])
+                return
 
-    def generate_video(self, prompt, image_url, output_path):
         # Create generation
         print(f"Starting video generation for {output_path}...")
         generation = self.client.generations.create(
@@ -55,18 +66,10 @@ class LumaVideoGenerator:
 
         # Download the video
         print(f"Downloading video to {output_path}...")
-        response = requests.get(video_url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 8192
-        downloaded = 0
-
-        with open(output_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=block_size):
-                file.write(chunk)
-                downloaded += len(chunk)
-                progress = (downloaded / total_size) * 100
-                print(f"Download progress for {output_path}: {progress:.2f}%", end='\r')
+        self.http.download_parallel(video_url, output_path, progress=print_progress(output_path))
         
+        if use_cache:
+            self.cache.put(cache_key, [output_path], {"video_url": video_url})
         print(f"\nVideo generated and saved to {output_path}")
 
 # Example usage
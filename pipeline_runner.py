@@ -0,0 +1,131 @@
+import asyncio
+import inspect
+import threading
+import time
+
+
+class Stage:
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+class PipelineRunner:
+    """Run pipeline stages as a dependency DAG, starting each stage as soon as its dependencies finish.
+
+    Each stage function is called with the results of its dependencies as keyword arguments
+    (keyed by stage name). Blocking functions run in a worker thread so independent branches overlap.
+
+    When a stage fails the remaining stages are cancelled. Coroutine stages stop at their next await,
+    but a blocking stage already running in a thread cannot be interrupted: it keeps running in the
+    background and its result is discarded. Long blocking stages can check runner.cancel_event to
+    stop early. Cancelled stages are reported with status "cancelled" in timings.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+        self.cancel_event = threading.Event()
+
+    def add_stage(self, name, func, deps=()):
+        if name in self.stages:
+            raise ValueError(f"Stage already defined: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage: {dep}")
+        self.stages[name] = Stage(name, func, deps)
+        return self
+
+    async def _run_stage(self, stage, tasks, started_at):
+        dep_results = {}
+        for dep in stage.deps:
+            dep_results[dep] = await tasks[dep]
+
+        start = time.time()
+        print(f"Starting stage: {stage.name}")
+        status = "failed"
+        try:
+            if inspect.iscoroutinefunction(stage.func):
+                result = await stage.func(**dep_results)
+            else:
+                result = await asyncio.to_thread(stage.func, **dep_results)
+            status = "completed"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            if not inspect.iscoroutinefunction(stage.func):
+                print(f"Stage {stage.name} cancelled; its worker thread keeps running until the call returns")
+            raise
+        finally:
+            end = time.time()
+            self.timings[stage.name] = {
+                "start": start - started_at,
+                "end": end - started_at,
+                "duration": end - start,
+                "status": status
+            }
+        print(f"Finished stage: {stage.name} in {end - start:.2f} seconds")
+        return result
+
+    async def run(self):
+        """Run all stages and return a dict of stage name to result."""
+        self.timings = {}
+        self.cancel_event.clear()
+        started_at = time.time()
+        tasks = {}
+        # Stages are registered after their dependencies, so insertion order is a valid topological order
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks, started_at))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except Exception:
+            self.cancel_event.set()
+            for task in tasks.values():
+                task.cancel()
+            # Let the cancelled stages record their status before reporting
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        self.timings["total"] = {"start": 0.0, "end": time.time() - started_at, "duration": time.time() - started_at}
+        return dict(zip(tasks.keys(), results))
+
+    def critical_path(self):
+        """Return the chain of stages that determined the total runtime."""
+        if not self.timings:
+            return []
+        path = []
+        current = max((name for name in self.stages if name in self.timings), key=lambda n: self.timings[n]["end"], default=None)
+        while current is not None:
+            path.append(current)
+            deps = [d for d in self.stages[current].deps if d in self.timings]
+            current = max(deps, key=lambda d: self.timings[d]["end"], default=None)
+        return list(reversed(path))
+
+    def format_timings(self):
+        lines = []
+        for name in self.stages:
+            if name in self.timings:
+                t = self.timings[name]
+                status = "" if t.get("status", "completed") == "completed" else f" [{t['status']}]"
+                lines.append(f"{name}: {t['duration']:.2f}s (start {t['start']:.2f}s, end {t['end']:.2f}s){status}")
+        if "total" in self.timings:
+            lines.append(f"total: {self.timings['total']['duration']:.2f}s")
+            lines.append(f"critical path: {' -> '.join(self.critical_path())}")
+        return "\n".join(lines)
+
+# Example usage
+if __name__ == "__main__":
+    def slow(seconds, value):
+        def stage(**deps):
+            time.sleep(seconds)
+            return value
+        return stage
+
+    runner = PipelineRunner()
+    runner.add_stage("images", slow(1, "images"))
+    runner.add_stage("song", slow(2, "song"))
+    runner.add_stage("videos", slow(1, "videos"), deps=["images"])
+    runner.add_stage("stitch", slow(0.5, "final"), deps=["videos", "song"])
+    print(asyncio.run(runner.run()))
+    print(runner.format_timings())
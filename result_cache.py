@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import uuid
+
+
+class ResultCache:
+    """On-disk, content-addressed cache for downloaded generation artifacts.
+
+    Keys are a hash of (provider, model, arguments, input file digests). Each entry is a directory
+    holding the artifact files plus a meta.json with the provider result, and the least recently
+    used entries are evicted once the cache grows past max_size_bytes.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, cache_dir="result_cache", max_size_bytes=5 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def default(cls):
+        """Shared process-wide cache, configured from RESULT_CACHE_DIR and RESULT_CACHE_MAX_BYTES."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(
+                    cache_dir=os.getenv("RESULT_CACHE_DIR", "result_cache"),
+                    max_size_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+                )
+            return cls._default
+
+    @staticmethod
+    def file_digest(path, chunk_size=1024 * 1024):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    @classmethod
+    def make_key(cls, provider, model, arguments, input_files=()):
+        key_data = json.dumps({
+            "provider": provider,
+            "model": model,
+            "arguments": arguments,
+            "input_files": [cls.file_digest(path) for path in input_files if path]
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """Return {"files": [...], "result": ...} for a cached entry, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            files = [os.path.join(entry_dir, name) for name in meta["files"]]
+            if not all(os.path.exists(path) for path in files):
+                raise FileNotFoundError(entry_dir)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        # Touch the metadata so eviction sees this entry as recently used
+        os.utime(meta_path, None)
+        with self._lock:
+            self._stats["hits"] += 1
+        return {"files": files, "result": meta.get("result")}
+
+    def put(self, key, file_paths, result=None):
+        """Copy the artifact files into the cache under key and return the cached entry."""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = os.path.join(self.cache_dir, f".tmp_{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        names = []
+        for i, path in enumerate(file_paths):
+            name = f"artifact_{i}{os.path.splitext(path)[1]}"
+            shutil.copyfile(path, os.path.join(tmp_dir, name))
+            names.append(name)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"files": names, "result": result, "created": time.time()}, f, default=str)
+
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        with self._lock:
+            self._stats["stores"] += 1
+        self.evict()
+        return {"files": [os.path.join(entry_dir, name) for name in names], "result": result}
+
+    @staticmethod
+    def restore(entry, output_paths):
+        """Copy cached artifacts to the caller's output paths."""
+        for cached_path, output_path in zip(entry["files"], output_paths):
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            shutil.copyfile(cached_path, output_path)
+        return output_paths
+
+    def _entries(self):
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if prefix.startswith(".tmp_") or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                meta_path = os.path.join(entry_dir, "meta.json")
+                if not os.path.exists(meta_path):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(meta_path), size, entry_dir))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size_bytes."""
+        if not self.max_size_bytes:
+            return 0
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, entry_dir in entries:
+            if total <= self.max_size_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            with self._lock:
+                self._stats["evictions"] += evicted
+        return evicted
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(entries)
+        stats["size_bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+# Example usage
+if __name__ == "__main__":
+    cache = ResultCache.default()
+    print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,139 @@
+import random
+import threading
+import email.utils
+import time
+
+
+class RetryStats:
+    """Thread-safe per-service counters for attempts, retries, give-ups and time spent backing off."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _service(self, service):
+        if service not in self._stats:
+            self._stats[service] = {"attempts": 0, "successes": 0, "retries": 0, "giveups": 0, "backoff_seconds": 0.0, "errors": {}}
+        return self._stats[service]
+
+    def record_attempt(self, service):
+        with self._lock:
+            self._service(service)["attempts"] += 1
+
+    def record_success(self, service):
+        with self._lock:
+            self._service(service)["successes"] += 1
+
+    def record_error(self, service, category, retried, delay=0.0):
+        with self._lock:
+            stats = self._service(service)
+            stats["errors"][category] = stats["errors"].get(category, 0) + 1
+            if retried:
+                stats["retries"] += 1
+                stats["backoff_seconds"] += delay
+            else:
+                stats["giveups"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {service: {**stats, "errors": dict(stats["errors"])} for service, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+retry_stats = RetryStats()
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, Retry-After support and error classification.
+
+    Errors are classified as rate_limit, timeout, connection, server, client, parse or unknown.
+    Client errors (4xx other than 408/409/429) are not retried since the same request will fail again.
+    """
+
+    RETRYABLE = {"rate_limit", "timeout", "connection", "server", "parse", "unknown"}
+
+    def __init__(self, max_retries=2, base_delay=0.5, max_delay=30.0, jitter=True, retryable=None, stats=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retryable = set(retryable) if retryable is not None else self.RETRYABLE
+        self.stats = stats or retry_stats
+
+    @staticmethod
+    def _status_code(exc):
+        status = getattr(exc, "status_code", None)
+        if status is None:
+            response = getattr(exc, "response", None)
+            status = getattr(response, "status_code", None)
+        if status is None:
+            # google.api_core exceptions expose the HTTP status as .code
+            code = getattr(exc, "code", None)
+            status = code if isinstance(code, int) else None
+        return status
+
+    def classify(self, exc):
+        status = self._status_code(exc)
+        name = type(exc).__name__
+        if status == 429 or "RateLimit" in name or "ResourceExhausted" in name:
+            return "rate_limit"
+        if status == 408 or isinstance(exc, TimeoutError) or "Timeout" in name or "DeadlineExceeded" in name:
+            return "timeout"
+        if "Connection" in name or isinstance(exc, ConnectionError):
+            return "connection"
+        if status is not None and (status >= 500 or status == 409):
+            return "server"
+        if status is not None and 400 <= status < 500:
+            return "client"
+        if isinstance(exc, ValueError):
+            return "parse"
+        return "unknown"
+
+    @staticmethod
+    def retry_after(exc):
+        """Return the server-requested delay in seconds from Retry-After headers, if any."""
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        value = headers.get("retry-after-ms")
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+    def should_retry(self, exc, attempt):
+        return attempt < self.max_retries and self.classify(exc) in self.retryable
+
+    def get_delay(self, exc, attempt):
+        server_delay = self.retry_after(exc)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def on_error(self, service, exc, attempt):
+        """Record the failure and return the delay before the next attempt, or None to give up."""
+        category = self.classify(exc)
+        if not self.should_retry(exc, attempt):
+            self.stats.record_error(service, category, retried=False)
+            return None
+        delay = self.get_delay(exc, attempt)
+        self.stats.record_error(service, category, retried=True, delay=delay)
+        return delay
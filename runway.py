@@ -1,73 +1,191 @@
 import os
-import requests
 import time
+import concurrent.futures
 import fal_client
 from dotenv import load_dotenv
+from result_cache import ResultCache
+from http_transport import HTTPTransport, print_progress
+from image_bytes import EncodedImage, encode_image
 
 class FalVideoGenerator:
-    def __init__(self):
+    def __init__(self, cache=None, http=None, image_format="PNG", image_quality=90):
         load_dotenv()
         self.api_key = os.environ.get("FAL_API_KEY")
         if not self.api_key:
             raise ValueError("FAL_API_KEY environment variable is not set. Please set it in your .env file or environment.")
         fal_client.api_key = self.api_key
+        self.cache = cache or ResultCache.default()
+        self.http = http or HTTPTransport.default()
+        # Used when images are passed in memory rather than as file paths. PNG keeps the model input
+        # lossless as before; pass image_format="JPEG" to trade some quality for smaller uploads
+        self.image_format = image_format
+        self.image_quality = image_quality
 
     def on_queue_update(self, update):
         if isinstance(update, fal_client.InProgress):
             for log in update.logs:
                 print(log["message"])
 
-    def generate_video(self, prompt, image_path, output_path):
+    MODEL = "fal-ai/runway-gen3/turbo/image-to-video"
+
+    def _arguments(self, prompt, image_url=None):
+        arguments = {
+            "prompt": prompt,
+            "duration": "5",  # Set duration to 5 seconds
+            "ratio": "9:16"  # Set aspect ratio to 9:16
+        }
+        if image_url:
+            arguments["image_url"] = image_url
+        return arguments
+
+    def _prepare_image(self, image):
+        """File paths are left as is; arrays and PIL images are encoded once into memory."""
+        if isinstance(image, str):
+            return image
+        return encode_image(image, self.image_format, self.image_quality)
+
+    def _upload_image(self, image):
+        if isinstance(image, EncodedImage):
+            return fal_client.upload(image.data, image.mime_type)
+        return fal_client.upload_file(image)
+
+    def _cache_key(self, prompt, image):
+        if isinstance(image, EncodedImage):
+            return self.cache.make_key("fal", self.MODEL, {**self._arguments(prompt), "image_sha256": image.digest})
+        return self.cache.make_key("fal", self.MODEL, self._arguments(prompt), [image])
+
+    def _restore_cached(self, cache_key, output_path):
+        cached = self.cache.get(cache_key)
+        if cached:
+            print(f"Cache hit. Restoring video to {output_path}")
+            self.cache.restore(cached, [output_path])
+            return True
+        return False
+
+    def _save_result(self, result, output_path, cache_key, use_cache):
+        # Get video URL from the completed generation
+        video_url = result.get('video', {}).get('url')
+        if not video_url:
+            raise Exception(f"Video URL not found in the generation response for {output_path}")
+
+        # Create the directory if it doesn't exist
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+        # Download the video
+        print(f"Downloading video to {output_path}...")
+        self.http.download_parallel(video_url, output_path, progress=print_progress(output_path))
+
+        if use_cache:
+            self.cache.put(cache_key, [output_path], result)
+        print(f"\nVideo generated and saved to {output_path}")
+
+    def generate_video(self, prompt, image, output_path, use_cache=True):
+        """image may be a file path, a numpy array or a PIL image."""
         print(f"Starting video generation for {output_path}...")
 
+        image = self._prepare_image(image)
+        cache_key = self._cache_key(prompt, image)
+        if use_cache and self._restore_cached(cache_key, output_path):
+            return
+
         # Upload the image to FAL's server
-        image_url = fal_client.upload_file(image_path)
+        image_url = self._upload_image(image)
         print(f"Image uploaded successfully. URL: {image_url}")
 
 
         # Create generation with duration and aspect ratio
         result = fal_client.subscribe(
-            "fal-ai/runway-gen3/turbo/image-to-video",
-            arguments={
-                "prompt": prompt,
-                "image_url": image_url,
-                "duration": "5",  # Set duration to 5 seconds
-                "ratio": "9:16"  # Set aspect ratio to 9:16
-            },
+            self.MODEL,
+            arguments=self._arguments(prompt, image_url),
             with_logs=True,
             on_queue_update=self.on_queue_update,
         )
         print(f"Generation completed. Result: {result}")
 
-        # Get video URL from the completed generation
-        video_url = result.get('video', {}).get('url')
-        if not video_url:
-            raise Exception(f"Video URL not found in the generation response for {output_path}")
+        self._save_result(result, output_path, cache_key, use_cache)
 
-        # Create the directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    def generate_videos(self, jobs, use_cache=True, poll_interval=5, timeout=1800, max_downloads=4, max_status_errors=5,
+                        cancel_event=None):
+        """Render many videos at once without a thread per job.
 
-        # Download the video
-        print(f"Downloading video to {output_path}...")
-        response = requests.get(video_url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 8192
-        downloaded = 0
-
-        with open(output_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=block_size):
-                file.write(chunk)
-                downloaded += len(chunk)
-                progress = (downloaded / total_size) * 100
-                print(f"Download progress for {output_path}: {progress:.2f}%", end='\r')
-        
-        print(f"\nVideo generated and saved to {output_path}")
+        jobs is a list of (prompt, image, output_path), where image is a file path, numpy array or PIL image. All uncached jobs are submitted to the fal
+        queue up front and tracked by a single status loop; finished videos are downloaded on a small
+        pool while the rest keep rendering. Jobs still running at the timeout are cancelled on fal, and a
+        job whose status check fails max_status_errors times in a row is cancelled and given up on.
+        Setting cancel_event (a threading.Event) cancels every job still rendering.
+        Returns output paths in the order of jobs, with None for any job that failed.
+        """
+        results = [None] * len(jobs)
+        handles = {}
+        cache_keys = {}
+        for index, (prompt, image, output_path) in enumerate(jobs):
+            image = self._prepare_image(image)
+            cache_keys[index] = self._cache_key(prompt, image)
+            if use_cache and self._restore_cached(cache_keys[index], output_path):
+                results[index] = output_path
+                continue
+            try:
+                image_url = self._upload_image(image)
+                handles[index] = fal_client.submit(self.MODEL, arguments=self._arguments(prompt, image_url))
+                print(f"Submitted video generation for {output_path} (request {handles[index].request_id})")
+            except Exception as e:
+                print(f"Failed to submit video generation for {output_path}: {e}")
+
+        def finish(index):
+            output_path = jobs[index][2]
+            self._save_result(handles[index].get(), output_path, cache_keys[index], use_cache)
+            return output_path
+
+        def cancel(index):
+            try:
+                handles[index].cancel()
+                print(f"Cancelled video generation for {jobs[index][2]}")
+            except Exception as e:
+                print(f"Could not cancel video generation for {jobs[index][2]}: {e}")
+
+        deadline = time.time() + timeout
+        downloads = {}
+        pending = set(handles)
+        status_errors = {index: 0 for index in handles}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_downloads) as executor:
+            while pending and time.time() < deadline:
+                if cancel_event is not None and cancel_event.is_set():
+                    print("Video generation cancelled by caller")
+                    break
+                for index in list(pending):
+                    try:
+                        status = handles[index].status()
+                        status_errors[index] = 0
+                    except Exception as e:
+                        status_errors[index] += 1
+                        print(f"Status check failed for {jobs[index][2]} ({status_errors[index]}/{max_status_errors}): {e}")
+                        if status_errors[index] >= max_status_errors:
+                            pending.discard(index)
+                            cancel(index)
+                        continue
+                    if isinstance(status, fal_client.Completed):
+                        pending.discard(index)
+                        downloads[executor.submit(finish, index)] = index
+                if pending:
+                    time.sleep(poll_interval)
+            for index in pending:
+                if cancel_event is None or not cancel_event.is_set():
+                    print(f"Video generation for {jobs[index][2]} timed out after {timeout} seconds")
+                # Stop the render so it doesn't keep running (and billing) on fal
+                cancel(index)
+
+            for future, index in downloads.items():
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"Video generation failed for {jobs[index][2]}: {e}")
+        return results
 
 # Example usage
 if __name__ == "__main__":
     generator = FalVideoGenerator()
     generator.generate_video(
         prompt="A bunny eating a carrot in the field.",
-        image_path="path/to/your/image.jpg",
+        image="path/to/your/image.jpg",
         output_path="bunny_video.mp4"
     )
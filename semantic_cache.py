@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import zlib
+import threading
+import numpy as np
+
+
+def normalize_prompt(text):
+    """Lowercase and collapse whitespace so trivially different prompts share a key."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class HashingEmbedder:
+    """Local, dependency-free embedding: signed feature hashing of character n-grams.
+
+    Good at catching near-duplicate strings (casing, punctuation, word order, small typos) without
+    a network round trip. Pass any callable mapping a list of strings to a 2-D array to
+    SemanticCache to use a model-based embedding instead.
+    """
+
+    def __init__(self, dim=256, ngram=3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def _embed_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f" {normalize_prompt(text)} "
+        for i in range(max(1, len(padded) - self.ngram + 1)):
+            h = zlib.crc32(padded[i:i + self.ngram].encode())
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def __call__(self, texts):
+        return np.stack([self._embed_one(text) for text in texts])
+
+
+class _FlatIndex:
+    """Brute-force cosine similarity over unit vectors, grown by doubling."""
+
+    def __init__(self, dim):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.values = []
+
+    def add(self, vector, value):
+        if self.size == len(self.vectors):
+            grown = np.zeros((max(64, 2 * len(self.vectors)), self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size] = vector
+        self.values.append(value)
+        self.size += 1
+
+    def search(self, vector):
+        if not self.size:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        best = int(np.argmax(scores))
+        return self.values[best], float(scores[best])
+
+
+class SemanticCache:
+    """Two-tier prompt cache: exact match on the normalised prompt, then nearest neighbour by embedding.
+
+    Entries are grouped by namespace (e.g. "groq/llama-3.1-70b-versatile/to_category") so that
+    prompts built from different templates never answer each other. Each namespace can have its
+    own similarity threshold.
+    """
+
+    DEFAULT_THRESHOLDS = {'to_category': 0.92, 'to_product': 0.95, 'to_domain': 0.97}
+
+    def __init__(self, embed_fn=None, default_threshold=0.95, thresholds=None):
+        self.embed_fn = embed_fn or HashingEmbedder()
+        self.default_threshold = default_threshold
+        self.thresholds = {**self.DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self._exact = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def threshold_for(self, namespace, method=None):
+        return self.thresholds.get(method or namespace.rsplit('/', 1)[-1], self.default_threshold)
+
+    def get(self, namespace, text, threshold=None):
+        key = normalize_prompt(text)
+        with self._lock:
+            exact = self._exact.get(namespace, {})
+            if key in exact:
+                self._stats["exact_hits"] += 1
+                return exact[key]
+            index = self._indexes.get(namespace)
+        if index is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        vector = self.embed_fn([text])[0]
+        with self._lock:
+            value, score = index.search(vector)
+            if value is not None and score >= (threshold if threshold is not None else self.threshold_for(namespace)):
+                self._stats["semantic_hits"] += 1
+                return value
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, namespace, text, value):
+        self.set_many(namespace, [text], [value])
+
+    def set_many(self, namespace, texts, values):
+        vectors = self.embed_fn(list(texts))
+        with self._lock:
+            exact = self._exact.setdefault(namespace, {})
+            for text, value, vector in zip(texts, values, vectors):
+                key = normalize_prompt(text)
+                if key in exact:
+                    continue
+                exact[key] = value
+                index = self._indexes.get(namespace)
+                if index is None:
+                    index = self._indexes[namespace] = _FlatIndex(len(vector))
+                index.add(vector, value)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = sum(len(entries) for entries in self._exact.values())
+        return stats
+
+    def save(self, path):
+        """Persist the exact-match entries; the vector index is rebuilt from them on load."""
+        with self._lock:
+            data = {namespace: dict(entries) for namespace, entries in self._exact.items()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            data = json.load(f)
+        for namespace, entries in data.items():
+            if entries:
+                self.set_many(namespace, list(entries.keys()), list(entries.values()))
@@ -0,0 +1,94 @@
+import os
+import asyncio
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking is unavailable, in-process coalescing still works
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key so only one of them does the work.
+
+    Callers that arrive while a call for the same key is in flight wait for it and receive
+    its result (or its exception) instead of repeating the request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = weakref.WeakKeyDictionary()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, coro_fn):
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            tasks[key] = task
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        # Shield so a cancelled waiter doesn't cancel the shared call for everyone else
+        return await asyncio.shield(task)
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, used to coalesce identical calls across worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def release(self):
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
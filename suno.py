@@ -1,20 +1,23 @@
 import time
-import requests
 import os
 from datetime import datetime
+from result_cache import ResultCache
+from http_transport import HTTPTransport
 
 class SongGenerator:
-    def __init__(self, base_url='https://suno-api-eight-weld.vercel.app'):
+    def __init__(self, base_url='https://suno-api-eight-weld.vercel.app', cache=None, http=None):
         self.base_url = base_url
+        self.cache = cache or ResultCache.default()
+        self.http = http or HTTPTransport.default()
 
     def _make_request(self, endpoint, method='GET', payload=None):
         url = f"{self.base_url}{endpoint}"
         headers = {'Content-Type': 'application/json'}
         
         if method == 'GET':
-            response = requests.get(url)
+            response = self.http.get(url)
         elif method == 'POST':
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.http.post(url, json=payload, headers=headers)
         
         return response.json()
 
@@ -62,15 +65,18 @@ class SongGenerator:
         raise TimeoutError("Audio generation timed out")
 
     def download_audio(self, url, filename):
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-            return filename
-        else:
-            raise Exception(f"Failed to download audio: HTTP {response.status_code}")
-
-    def generate_song(self, prompt, make_instrumental=True, output_dir='generated_songs'):
+        return self.http.download(url, filename)
+
+    def generate_song(self, prompt, make_instrumental=True, output_dir='generated_songs', use_cache=True):
+        cache_key = self.cache.make_key("suno", self.base_url, {"prompt": prompt, "make_instrumental": make_instrumental})
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached:
+                print("Cache hit. Restoring generated songs.")
+                os.makedirs(output_dir, exist_ok=True)
+                filenames = [os.path.join(output_dir, f"generated_song_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{i+1}.mp3") for i in range(len(cached["files"]))]
+                return self.cache.restore(cached, filenames)
+
         # Generate initial audio
         data = self.generate_audio(prompt, make_instrumental)
 
@@ -96,6 +102,9 @@ class SongGenerator:
             filename = os.path.join(output_dir, f"generated_song_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{i+1}.mp3")
             mp3_file = self.download_audio(item['audio_url'], filename)
             mp3_files.append(mp3_file)
+
+        if use_cache and mp3_files:
+            self.cache.put(cache_key, mp3_files, audio_info)
         
         return mp3_files
 
@@ -0,0 +1,126 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookReceiver:
+    """Small local HTTP server that receives prediction-completed webhooks.
+
+    Run it behind a publicly reachable URL (e.g. a tunnel) and pass that URL as the webhook when
+    creating predictions. Deliveries must carry a valid Replicate signature (webhook-id,
+    webhook-timestamp and webhook-signature headers, signed with the account's webhook secret),
+    and are only kept for prediction ids somebody is currently waiting on.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, host="127.0.0.1", port=8765, secret=None, tolerance=300):
+        self.host = host
+        self.port = port
+        secret = secret or os.getenv("REPLICATE_WEBHOOK_SECRET")
+        if not secret:
+            raise ValueError("A webhook secret is required; set REPLICATE_WEBHOOK_SECRET")
+        self._key = base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+        self.tolerance = tolerance
+        self._results = {}
+        self._events = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @classmethod
+    def shared(cls, host="127.0.0.1", port=8765, secret=None):
+        """One started receiver per host/port, so several generators can share the port."""
+        with cls._shared_lock:
+            if (host, port) not in cls._shared:
+                cls._shared[(host, port)] = cls(host, port, secret).start()
+            return cls._shared[(host, port)]
+
+    def verify(self, headers, body):
+        webhook_id = headers.get("webhook-id")
+        timestamp = headers.get("webhook-timestamp")
+        signatures = headers.get("webhook-signature")
+        if not (webhook_id and timestamp and signatures):
+            return False
+        try:
+            if abs(time.time() - int(timestamp)) > self.tolerance:
+                return False
+        except ValueError:
+            return False
+        signed = f"{webhook_id}.{timestamp}.".encode() + body
+        expected = base64.b64encode(hmac.new(self._key, signed, hashlib.sha256).digest()).decode()
+        # The header may carry several space-separated "v1,<signature>" values during secret rotation
+        return any(hmac.compare_digest(expected, candidate.split(",", 1)[-1]) for candidate in signatures.split())
+
+    def expect(self, prediction_id):
+        """Register interest in prediction_id; deliveries for unregistered ids are dropped."""
+        with self._lock:
+            self._events.setdefault(prediction_id, threading.Event())
+
+    def _deliver(self, payload):
+        prediction_id = payload.get("id")
+        with self._lock:
+            event = self._events.get(prediction_id)
+            if event is None:
+                return
+            self._results[prediction_id] = payload
+        event.set()
+
+    def start(self):
+        if self._server is not None:
+            return self
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if not receiver.verify(self.headers, body):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                except json.JSONDecodeError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                receiver._deliver(payload)
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"Webhook receiver listening on {self.host}:{self.port}")
+        return self
+
+    def wait(self, prediction_id, timeout=None):
+        """Block until the webhook for prediction_id arrives; returns the payload or None on timeout."""
+        self.expect(prediction_id)
+        with self._lock:
+            event = self._events[prediction_id]
+        if not event.wait(timeout):
+            return None
+        with self._lock:
+            return self._results.get(prediction_id)
+
+    def discard(self, prediction_id):
+        with self._lock:
+            self._results.pop(prediction_id, None)
+            self._events.pop(prediction_id, None)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None